@@ -0,0 +1,135 @@
+"""Admission control for the bcrypt-heavy endpoints (/token and /users/).
+
+Every request spends a token from a per-IP token bucket, and bcrypt work is
+capped per process. Logins also spend one from a per-account bucket; their
+per-IP bucket is far larger, since a whole school can log in from behind one
+NAT address and the per-account and hash-capacity checks already bound the work. Requests over a limit are
+rejected at once with 429 and a Retry-After header instead of queueing for
+CPU that quiz delivery needs.
+
+Buckets live in a ``RateLimitStore``. The default ``MemoryRateLimitStore`` is
+per process; pass a shared implementation (e.g. backed by Redis) to
+``configure`` so all workers enforce the same limits.
+"""
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from cachetools import LRUCache
+from fastapi import HTTPException, status
+
+from . import auth
+
+@dataclass(frozen=True)
+class Rule:
+    rate: float # Tokens added per second
+    burst: int # Bucket capacity
+
+class RateLimitStore(ABC):
+    """Storage for token buckets. ``take`` must be atomic per key."""
+
+    @abstractmethod
+    async def take(self, key, rule):
+        """Spend one token from ``key``'s bucket; returns 0 if allowed, else seconds until it would be."""
+
+    @abstractmethod
+    async def clear(self):
+        """Forget every bucket."""
+
+class MemoryRateLimitStore(RateLimitStore):
+    """In-process token buckets, least recently used keys evicted past ``max_keys``."""
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = LRUCache(max_keys)
+        self._lock = threading.Lock()
+
+    async def take(self, key, rule):
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (rule.burst, now))
+            tokens = min(rule.burst, tokens + (now - updated) * rule.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rule.rate
+
+    async def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+def env_rule(name, rate, burst):
+    return Rule(rate=float(os.getenv(f"{name}_RATE", rate)), burst=int(os.getenv(f"{name}_BURST", burst)))
+
+class AdmissionController:
+    def __init__(self, store, ip_rule, login_ip_rule, account_rule, max_pending_hashes):
+        self.store = store
+        self.ip_rule = ip_rule
+        self.login_ip_rule = login_ip_rule
+        self.account_rule = account_rule
+        self.max_pending_hashes = max_pending_hashes
+        self.admitted = 0
+        self.rejected = {"ip": 0, "account": 0, "hash_capacity": 0}
+
+    def reject(self, reason, retry_after):
+        self.rejected[reason] += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def check_rate(self, reason, key, rule):
+        retry_after = await self.store.take(f"{reason}:{key}", rule)
+        if retry_after:
+            self.reject(reason, retry_after)
+
+    def check_hash_capacity(self):
+        pool = auth.password_pool
+        if pool.in_flight >= self.max_pending_hashes:
+            # Roughly when the queue ahead will have drained
+            average = pool.total_seconds / pool.completed if pool.completed else 0.2
+            self.reject("hash_capacity", average * pool.in_flight / pool.max_workers)
+
+    async def admit(self, client_ip, account=None):
+        """Raise a 429 unless a request from ``client_ip`` (for ``account``) may hash a password now."""
+        if account is None:
+            await self.check_rate("ip", client_ip, self.ip_rule)
+        else:
+            await self.check_rate("ip", f"login:{client_ip}", self.login_ip_rule)
+            await self.check_rate("account", account.lower(), self.account_rule)
+        self.check_hash_capacity()
+        self.admitted += 1
+
+    def stats(self):
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "pending_hashes": auth.password_pool.in_flight,
+            "max_pending_hashes": self.max_pending_hashes,
+        }
+
+def client_ip(request):
+    # uvicorn replaces the peer with the X-Forwarded-For address only for
+    # proxies listed in --forwarded-allow-ips, so clients cannot spoof it
+    return request.client.host if request.client else "unknown"
+
+def configure(store=None, ip_rule=None, login_ip_rule=None, account_rule=None, max_pending_hashes=None):
+    """Replace the global controller, e.g. to share buckets between workers."""
+    global controller
+    controller = AdmissionController(
+        store=store or MemoryRateLimitStore(),
+        ip_rule=ip_rule or env_rule("ADMISSION_IP", 1, 20),
+        login_ip_rule=login_ip_rule or env_rule("ADMISSION_LOGIN_IP", 20, 1000),
+        account_rule=account_rule or env_rule("ADMISSION_ACCOUNT", 0.1, 5),
+        # Hashes running or queued on the password pool; beyond this a new one
+        # would wait longer than a client should
+        max_pending_hashes=max_pending_hashes or int(os.getenv("ADMISSION_MAX_PENDING_HASHES", "0")) or 4 * auth.password_pool.max_workers,
+    )
+    return controller
+
+controller = configure()
@@ -0,0 +1,165 @@
+"""Per-mock-test analytics, maintained as results arrive.
+
+Score distributions are kept as one row per (mock test, section, score) in
+``mock_test_score_buckets`` and bumped by ``create_test_result``. Per-question
+percent-correct lives in ``mock_test_question_stats`` and is bumped on submit,
+the only place the raw answers are seen. Reading a test's analytics therefore
+costs the same no matter how many results it has.
+
+The score buckets can be rebuilt from ``test_results`` at any time:
+
+    python -m app.analytics                  # every mock test
+    python -m app.analytics --mock-test 12   # one mock test
+
+Answers are not stored, so the per-question statistics cannot be rebuilt.
+"""
+import argparse
+import math
+
+from sqlalchemy import String, bindparam, case, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import models
+from .database import engine
+from .grading import GRADED_SECTIONS
+
+PERCENTILES = (25, 50, 75, 90)
+
+# INSERT ... ON CONFLICT DO UPDATE for each supported backend
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+async def increment(db, model, keys, counters, rows):
+    """Insert ``rows``, adding their ``counters`` to existing rows with the same ``keys``.
+
+    A single executemany statement, atomic per row, so concurrent writers
+    never lose an update.
+    """
+    if not rows:
+        return
+    stmt = UPSERTS[db.get_bind().dialect.name](model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters},
+    )
+    await db.execute(stmt, rows)
+
+async def record_result(db, test_result):
+    rows = [
+        {"mock_test_id": test_result.mock_test_id, "section": section, "score": getattr(test_result, f"{section}_score"), "count": 1}
+        for section in GRADED_SECTIONS
+    ]
+    await increment(db, models.MockTestScoreBucket, ["mock_test_id", "section", "score"], ["count"], rows)
+
+async def record_answers(db, answer_key, answers):
+    """Count one attempt at every question of each graded section in ``answers``.
+
+    The key can be older than the committed test: another worker's cache, or
+    an edit that landed while it was compiled. So each row is inserted from
+    the committed question itself. A question that no longer exists is
+    skipped, and the answer is marked against the current correct answer.
+    """
+    rows = [
+        {"question_id": int(question_id), "mock_test_id": answer_key.mock_test_id, "section": section, "answer": (answers[section] or {}).get(question_id)}
+        for section in GRADED_SECTIONS if section in answers
+        for question_id in answer_key.sections.get(section, {})
+    ]
+    if not rows:
+        return
+    question, section = models.MockTestQuestion, models.MockTestSection
+    committed = (
+        select(
+            question.id, section.mock_test_id, section.title, literal(1),
+            case((question.correct_answer == bindparam("answer", type_=String), 1), else_=0),
+        )
+        .join_from(question, section, question.section_id == section.id)
+        .where(
+            question.id == bindparam("question_id"),
+            section.mock_test_id == bindparam("mock_test_id"),
+            section.title == bindparam("section"),
+        )
+    )
+    stat = models.MockTestQuestionStat.__table__
+    stmt = UPSERTS[db.get_bind().dialect.name](stat).from_select(["question_id", "mock_test_id", "section", "attempts", "correct"], committed)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["question_id"],
+        set_={name: stat.c[name] + stmt.excluded[name] for name in ("attempts", "correct")},
+    )
+    await db.execute(stmt, rows)
+
+async def clear_question_stats(db, test_id):
+    # Questions are replaced on every edit, so their statistics go with them
+    await db.execute(delete(models.MockTestQuestionStat).where(models.MockTestQuestionStat.mock_test_id == test_id))
+
+async def clear(db, test_id):
+    await clear_question_stats(db, test_id)
+    await db.execute(delete(models.MockTestScoreBucket).where(models.MockTestScoreBucket.mock_test_id == test_id))
+
+def percentile(histogram, count, p):
+    # Nearest-rank percentile of a {score: count} histogram
+    rank = max(1, math.ceil(p / 100 * count))
+    seen = 0
+    for score in sorted(histogram):
+        seen += histogram[score]
+        if seen >= rank:
+            return score
+
+def summarize(histogram):
+    count = sum(histogram.values())
+    if not count:
+        return {"count": 0, "mean": None, "percentiles": {}, "histogram": {}}
+    return {
+        "count": count,
+        "mean": round(sum(score * n for score, n in histogram.items()) / count, 2),
+        "percentiles": {f"p{p}": percentile(histogram, count, p) for p in PERCENTILES},
+        "histogram": dict(sorted(histogram.items())),
+    }
+
+async def read_analytics(db, test_id):
+    bucket = models.MockTestScoreBucket
+    histograms = {section: {} for section in GRADED_SECTIONS}
+    rows = await db.execute(select(bucket.section, bucket.score, bucket.count).where(bucket.mock_test_id == test_id))
+    for section, score, count in rows:
+        histograms.setdefault(section, {})[score] = count
+    stat = models.MockTestQuestionStat
+    stats = await db.scalars(select(stat).where(stat.mock_test_id == test_id).order_by(stat.question_id))
+    return {
+        "mock_test_id": test_id,
+        "sections": {section: summarize(histogram) for section, histogram in histograms.items()},
+        "questions": [
+            {
+                "question_id": s.question_id,
+                "section": s.section,
+                "attempts": s.attempts,
+                "correct": s.correct,
+                "percent_correct": round(100 * s.correct / s.attempts, 1) if s.attempts else None,
+            }
+            for s in stats
+        ],
+    }
+
+def backfill(conn, mock_test_id=None):
+    """Rebuild the score buckets from test_results, for every mock test or just one."""
+    buckets = models.MockTestScoreBucket.__table__
+    results = models.TestResult.__table__
+    stale = delete(buckets)
+    if mock_test_id is not None:
+        stale = stale.where(buckets.c.mock_test_id == mock_test_id)
+    conn.execute(stale)
+    for section in GRADED_SECTIONS:
+        score = results.c[f"{section}_score"]
+        query = (
+            select(results.c.mock_test_id, literal(section), score, func.count())
+            .where(results.c.mock_test_id.is_not(None), score.is_not(None))
+            .group_by(results.c.mock_test_id, score)
+        )
+        if mock_test_id is not None:
+            query = query.where(results.c.mock_test_id == mock_test_id)
+        conn.execute(insert(buckets).from_select(["mock_test_id", "section", "score", "count"], query))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild mock-test score distributions from stored results.")
+    parser.add_argument("--mock-test", type=int, help="only rebuild this mock test")
+    args = parser.parse_args()
+    with engine.begin() as conn:
+        backfill(conn, args.mock_test)
+    print("Score distributions rebuilt")
@@ -1,19 +1,17 @@
 from passlib.context import CryptContext
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .models import User # Import User model
-from .database import SessionLocal
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from .database import get_db
+from .pools import WorkerPool
+from .cache import Cache
+from . import metrics, schemas
 
 # Configuration for JWT
 SECRET_KEY = "your-secret-key"
@@ -22,6 +20,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Authenticated users keyed on token subject (email), so most requests skip the
+# user lookup. Entries are invalidated when an admin updates or deletes the user;
+# the TTL bounds staleness across worker processes.
+principal_cache = Cache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
+
+def invalidate_principal(email):
+    principal_cache.invalidate(email)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
@@ -30,6 +39,40 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def new_user_error(email, password, re_password):
+    """Why a sign-up with these credentials is refused, or None if it is acceptable."""
+    if password != re_password:
+        return "Passwords do not match"
+    if not email.endswith("@gmail.com"):
+        return "Only Gmail addresses are allowed"
+    if len(password) < 8:
+        return "Password must be at least 8 characters"
+    if not any(c.isdigit() for c in password) or not any(c.isalpha() for c in password):
+        return "Password must contain both letters and numbers"
+    return None
+
+# bcrypt costs ~200ms of CPU per call, so it runs on a bounded pool instead of
+# the event loop. PASSWORD_HASH_WORKERS caps concurrent hashes (default: one per
+# core), PASSWORD_HASH_POOL selects "thread" or "process" workers.
+password_pool = WorkerPool(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or None,
+    kind=os.getenv("PASSWORD_HASH_POOL", "thread"),
+)
+
+def configure_password_pool(max_workers=None, kind="thread"):
+    global password_pool
+    password_pool.shutdown()
+    password_pool = WorkerPool(max_workers=max_workers, kind=kind)
+    return password_pool
+
+async def verify_password_async(plain_password, hashed_password):
+    with metrics.time_password_hash():
+        return await password_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    with metrics.time_password_hash():
+        return await password_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,14 +83,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db, email, password):
-    from .models import User
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db, email, password):
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user or not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -60,22 +102,29 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    user = principal_cache.get(email)
     if user is None:
-        raise credentials_exception
+        # A role change or deletion committed after this load must not be
+        # overwritten by the principal it replaced
+        generation = principal_cache.generation()
+        db_user = await db.scalar(select(User).where(User.email == email))
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user, from_attributes=True)
+        principal_cache.set(email, user, generation)
     return user
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
     return current_user
 
-def get_current_teacher_user(current_user: User = Depends(get_current_active_user)):
+async def get_current_teacher_user(current_user: User = Depends(get_current_active_user)):
     if current_user.role != "teacher":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
     return current_user
\ No newline at end of file
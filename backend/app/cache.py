@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+from cachetools import LRUCache, TTLCache
+
+# Invalidated keys remembered for Cache.set's generation check
+TRACKED_INVALIDATIONS = 10000
+
+class Cache:
+    """Thread-safe LRU cache (optionally with a TTL) that counts hits and misses.
+
+    ``maxsize`` bounds the number of entries, or the total of ``getsizeof``
+    over all values when given. Values too large to fit are simply not cached.
+
+    A value computed from the database can be outdated by the time it is
+    stored, if a write invalidated the key while it was being loaded. Take
+    ``generation()`` before loading and pass it to ``set``, which then skips
+    storing a value whose key has been invalidated since.
+    """
+
+    def __init__(self, maxsize, ttl=None, getsizeof=None):
+        if ttl:
+            self._cache = TTLCache(maxsize, ttl, getsizeof=getsizeof)
+        else:
+            self._cache = LRUCache(maxsize, getsizeof=getsizeof)
+        self._lock = threading.Lock()
+        self._generation = 0 # Bumped by every invalidation
+        self._invalidated = OrderedDict() # key: generation of its last invalidation, oldest first
+        self._forgotten = 0 # Newest generation dropped from _invalidated
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and (
+                self._invalidated.get(key, 0) > generation
+                # Can no longer tell whether this key was invalidated
+                or self._forgotten > generation
+            ):
+                return
+            try:
+                self._cache[key] = value
+            except ValueError:
+                # Larger than the whole cache
+                pass
+
+    def invalidate(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > TRACKED_INVALIDATIONS:
+                _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "currsize": self._cache.currsize,
+                "maxsize": self._cache.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
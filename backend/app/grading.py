@@ -0,0 +1,127 @@
+import os
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import chain, repeat
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlalchemy import select
+
+from . import models
+from .cache import Cache
+
+GRADED_SECTIONS = ("listening", "reading")
+
+@dataclass(frozen=True)
+class AnswerKey:
+    """Correct answers of one mock test, compiled for grading without the ORM.
+
+    ``sections`` maps a section title to ``{str(question_id): correct_answer}``,
+    keyed the same way as ``MockTestSubmission.answers``.
+    """
+
+    mock_test_id: int
+    sections: Mapping[str, Mapping[str, str]]
+
+    def total(self, section):
+        return len(self.sections.get(section, ()))
+
+    def score(self, section, answers):
+        key = self.sections.get(section)
+        if not key or not answers:
+            return 0
+        return sum(1 for question_id, answer in answers.items() if key.get(question_id) == answer)
+
+    @cached_property
+    def encoded(self):
+        """Per section: (question ids, {question id: column}, {answer: code}, array of correct codes).
+
+        Answers are encoded as small integers so a whole cohort can be compared
+        against the key as one integer matrix.
+        """
+        import numpy as np  # only needed for batch grading; keeps worker start-up fast
+        encoded = {}
+        for section in GRADED_SECTIONS:
+            key = self.sections.get(section, {})
+            question_ids = tuple(key)
+            columns = {question_id: column for column, question_id in enumerate(question_ids)}
+            codes = {answer: code for code, answer in enumerate(dict.fromkeys(key.values()))}
+            correct = np.array([codes[key[question_id]] for question_id in question_ids], dtype=np.int32)
+            encoded[section] = (question_ids, columns, codes, correct)
+        return encoded
+
+# Compiled keys by mock test id. update_mock_test and delete_mock_test drop the
+# entry; the TTL bounds staleness in other worker processes.
+answer_key_cache = Cache(
+    maxsize=int(os.getenv("ANSWER_KEY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_KEY_CACHE_TTL", "300")),
+)
+
+async def compile_answer_key(db, test_id):
+    query = (
+        select(models.MockTest.id, models.MockTestSection.title, models.MockTestQuestion.id, models.MockTestQuestion.correct_answer)
+        .outerjoin(models.MockTestSection, (models.MockTestSection.mock_test_id == models.MockTest.id) & models.MockTestSection.title.in_(GRADED_SECTIONS))
+        .outerjoin(models.MockTestQuestion, models.MockTestQuestion.section_id == models.MockTestSection.id)
+        .where(models.MockTest.id == test_id)
+    )
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return None
+    sections = {}
+    for _, title, question_id, correct_answer in rows:
+        if title is None:
+            continue
+        section = sections.setdefault(title, {})
+        if question_id is not None:
+            section[str(question_id)] = correct_answer
+    return AnswerKey(
+        mock_test_id=test_id,
+        sections=MappingProxyType({title: MappingProxyType(key) for title, key in sections.items()}),
+    )
+
+async def get_answer_key(db, test_id):
+    key = answer_key_cache.get(test_id)
+    if key is None:
+        # update_mock_test invalidates after committing, so a key compiled
+        # while an edit lands is used once but not cached
+        generation = answer_key_cache.generation()
+        key = await compile_answer_key(db, test_id)
+        if key is not None:
+            answer_key_cache.set(test_id, key, generation)
+    return key
+
+def invalidate_answer_key(test_id):
+    answer_key_cache.invalidate(test_id)
+
+def grade_batch(answer_key, submissions):
+    """Grade many submissions of one mock test in a single vectorised pass.
+
+    ``submissions`` is a list of ``{section: {question_id: answer}}`` dicts.
+    Returns, per graded section, the question ids, a score per submission and
+    a submissions x questions boolean correctness matrix.
+    """
+    import numpy as np
+    graded = {}
+    for section, (question_ids, columns, codes, correct) in answer_key.encoded.items():
+        section_answers = [answers.get(section) or {} for answers in submissions]
+        counts = np.fromiter(map(len, section_answers), dtype=np.intp, count=len(section_answers))
+        answered = int(counts.sum())
+        # One flat pass over every submitted (question id, answer) pair, with the
+        # lookups done by C-level map() instead of a Python loop. -1 marks an
+        # unknown question id or an answer that is in no correct answer.
+        rows = np.repeat(np.arange(len(section_answers)), counts)
+        cols = np.fromiter(map(columns.get, chain.from_iterable(section_answers), repeat(-1)), dtype=np.intp, count=answered)
+        answer_codes = np.fromiter(
+            map(codes.get, chain.from_iterable(map(dict.values, section_answers)), repeat(-1)), dtype=np.int32, count=answered,
+        )
+        known = cols >= 0
+        # Unanswered questions stay -1, which never matches a correct code
+        submitted = np.full((len(section_answers), len(question_ids)), -1, dtype=np.int32)
+        submitted[rows[known], cols[known]] = answer_codes[known]
+        is_correct = submitted == correct
+        graded[section] = {
+            "question_ids": question_ids,
+            "scores": is_correct.sum(axis=1),
+            "correct": is_correct,
+        }
+    return graded
@@ -0,0 +1,111 @@
+import os
+import time
+
+from sortedcontainers import SortedList
+from sqlalchemy import func, select
+
+from . import models
+from .cache import Cache
+
+class Leaderboard:
+    """Each user's best total (listening + reading) for one mock test, kept sorted.
+
+    Entries are ``(-score, result_id, user_id)``, so the list runs from the
+    highest score down and ties go to whoever reached the score first. Adding
+    a result, a user's rank and the top N all cost O(log n) (plus N).
+    Ranks are competition ranks: equal scores share a rank.
+    """
+
+    def __init__(self, mock_test_id):
+        self.mock_test_id = mock_test_id
+        self.last_result_id = 0
+        self.refreshed_at = 0.0
+        self._entries = SortedList()
+        self._best = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, result_id, user_id, score):
+        entry = (-score, result_id, user_id)
+        current = self._best.get(user_id)
+        if current is not None:
+            if current <= entry:
+                return # Not an improvement (or already counted)
+            self._entries.remove(current)
+        self._entries.add(entry)
+        self._best[user_id] = entry
+
+    def rank(self, user_id):
+        entry = self._best.get(user_id)
+        if entry is None:
+            return None
+        return {"rank": self._entries.bisect_left((entry[0],)) + 1, "user_id": user_id, "score": -entry[0]}
+
+    def top(self, n):
+        entries = []
+        for index, (negative_score, _, user_id) in enumerate(self._entries.islice(0, n)):
+            rank = index + 1
+            if entries and entries[-1]["score"] == -negative_score:
+                rank = entries[-1]["rank"]
+            entries.append({"rank": rank, "user_id": user_id, "score": -negative_score})
+        return entries
+
+class Leaderboards:
+    """Per-process leaderboards by mock test id.
+
+    A board is built from ``test_results`` the first time it is read, then
+    fed by ``record`` as this process stores results. Results stored by other
+    worker processes are picked up at most ``refresh_interval`` seconds later
+    by reading only rows newer than the last one seen.
+    """
+
+    def __init__(self, max_boards=256, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self._boards = Cache(maxsize=max_boards)
+
+    async def get(self, db, test_id):
+        """The board for ``test_id``, or None if the mock test does not exist."""
+        board = self._boards.get(test_id)
+        if board is None:
+            if await db.scalar(select(models.MockTest.id).where(models.MockTest.id == test_id)) is None:
+                return None
+            board = Leaderboard(test_id)
+            self._boards.set(test_id, board)
+        if time.monotonic() - board.refreshed_at >= self.refresh_interval:
+            await self.refresh(db, board)
+        return board
+
+    async def refresh(self, db, board):
+        result = models.TestResult
+        score = func.coalesce(result.listening_score, 0) + func.coalesce(result.reading_score, 0)
+        rows = await db.execute(
+            select(result.id, result.user_id, score)
+            .where(result.mock_test_id == board.mock_test_id, result.id > board.last_result_id)
+            .order_by(result.id)
+        )
+        for result_id, user_id, total in rows:
+            board.add(result_id, user_id, total)
+            # Only refreshes move the cursor: results recorded in this process
+            # may be newer than ones other workers stored, which are still unread
+            board.last_result_id = result_id
+        board.refreshed_at = time.monotonic()
+
+    def record(self, test_result):
+        board = self._boards.get(test_result.mock_test_id)
+        if board is not None:
+            board.add(test_result.id, test_result.user_id, (test_result.listening_score or 0) + (test_result.reading_score or 0))
+
+    def invalidate(self, test_id):
+        self._boards.invalidate(test_id)
+
+    def clear(self):
+        self._boards.clear()
+
+    def stats(self):
+        return {**self._boards.stats(), "refresh_interval": self.refresh_interval}
+
+leaderboards = Leaderboards(
+    max_boards=int(os.getenv("LEADERBOARD_CACHE_SIZE", "256")),
+    refresh_interval=float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "1.0")),
+)
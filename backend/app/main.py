@@ -1,17 +1,32 @@
-
-
-from fastapi import FastAPI, Depends, HTTPException, status, Response
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query
+from typing import Optional
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app import models, schemas, auth
-from app.database import SessionLocal, engine, init_db
+from pydantic import ValidationError
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app import models, schemas, admission, auth, analytics, grading, metrics, profiler, question_bank, responses, search, streams, user_import, writing
+from app.leaderboard import leaderboards
+from app.database import async_engine, get_db, pool_stats
+import asyncio
 import json
+import time
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
-# Initialize the database
-init_db()
+# The schema is managed by migrations (python -m app.migrations), run once per
+# deploy; workers never run DDL on startup.
+
+@asynccontextmanager
+async def lifespan(app):
+    # Re-queues writing-feedback jobs lost by a previous process; see FeedbackJobQueue
+    sweeper = asyncio.create_task(writing.feedback_queue.sweep())
+    yield
+    sweeper.cancel()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware before any route definitions
 app.add_middleware(
@@ -22,51 +37,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Only does anything with QUERY_PROFILER=1; see /admin/query-profiles/
+app.add_middleware(profiler.ProfilerMiddleware)
+
+# Outermost, so it times everything else; see /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Explicit OPTIONS handler for /users/ to handle CORS preflight
 @app.options("/users/")
 async def options_users():
     return Response(status_code=200)
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Relationship graphs returned by the content endpoints. Async sessions cannot
+# lazy load, so every attribute the response schema touches is loaded up front.
+QUIZ_GRAPH = (selectinload(models.Quiz.questions),)
+MOCK_TEST_GRAPH = (selectinload(models.MockTest.sections).selectinload(models.MockTestSection.questions),)
+
+async def get_quiz(db, quiz_id, owner_id):
+    query = select(models.Quiz).options(*QUIZ_GRAPH).where(models.Quiz.id == quiz_id, models.Quiz.owner_id == owner_id)
+    return await db.scalar(query)
+
+async def get_mock_test(db, test_id, owner_id=None):
+    query = select(models.MockTest).options(*MOCK_TEST_GRAPH).where(models.MockTest.id == test_id)
+    if owner_id is not None:
+        query = query.where(models.MockTest.owner_id == owner_id)
+    return await db.scalar(query)
+
+# Validators for conditional GETs of the content routes. The peek_* queries read
+# them without loading any object graph; tag_* derive the same values from
+# loaded objects.
+async def peek_item(db, model, kind, item_id, owner_id):
+    query = select(model.version, model.updated_at).where(model.id == item_id, model.owner_id == owner_id)
+    row = (await db.execute(query)).first()
+    return responses.item_validators(kind, item_id, *row) if row else None
+
+def tag_item(kind, item):
+    return responses.item_validators(kind, item.id, item.version, item.updated_at)
+
+async def peek_list(db, model, kind, owner_id):
+    query = select(func.count(model.id), func.max(model.id), func.sum(model.version), func.max(model.updated_at)).where(model.owner_id == owner_id)
+    return responses.list_validators(kind, owner_id, *(await db.execute(query)).one())
+
+def tag_list(kind, owner_id, items):
+    return responses.list_validators(
+        kind,
+        owner_id,
+        len(items),
+        max((item.id for item in items), default=None),
+        sum(item.version for item in items),
+        max((item.updated_at for item in items), default=None),
+    )
+
+async def serve_content(request, key, owner_id, schema, load, peek, tag):
+    """Serve a content read from responses.content_cache, or a 304.
+
+    On a cache miss a conditional request is first checked against ``peek()``,
+    so an unchanged object never has its graph loaded. Otherwise ``load()``
+    fetches the graph and ``tag(value)`` gives its validators. Returns None
+    when the content does not exist.
+    """
+    cached = responses.content_cache.get(key)
+    if cached is None or cached.owner_id != owner_id:
+        # The write routes invalidate after committing, so a load that overlaps
+        # a write is served once but not cached
+        generation = responses.content_cache.generation()
+        if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+            validators = await peek()
+            if validators is None:
+                return None
+            if validators.matches(request.headers):
+                return validators.not_modified(request.headers)
+        value = await load()
+        if value is None:
+            return None
+        cached = responses.serialize(schema, value, tag(value), owner_id=owner_id)
+        responses.content_cache.set(key, cached, generation)
+    return cached.to_response(request.headers)
+
+async def paginate(db, query, key_column, cursor, limit):
+    # Keyset pagination: seek past the last key instead of OFFSET, so every
+    # page costs the same no matter how deep it is.
+    if cursor is not None:
+        query = query.where(key_column > cursor)
+    rows = (await db.scalars(query.order_by(key_column).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], key_column.key)
+    return {"items": rows, "next_cursor": next_cursor}
+
+async def insert_questions(db, model, questions, **parent):
+    # One executemany INSERT for the whole list instead of a flush per row
+    rows = [
+        {"text": q.text, "options": q.options, "correct_answer": q.correct_answer, **parent}
+        for q in questions or []
+    ]
+    if rows:
+        await db.execute(insert(model), rows)
+
+# Content writes shared by the create routes and the question-bank import; the
+# caller commits.
+async def add_quiz(db, quiz, owner_id):
+    db_quiz = models.Quiz(title=quiz.title, description=quiz.description, owner_id=owner_id)
+    db.add(db_quiz)
+    await db.flush()
+    await insert_questions(db, models.Question, quiz.questions, quiz_id=db_quiz.id)
+    await search.index(db, "quiz", db_quiz.id)
+    return db_quiz
+
+async def add_mock_test(db, mock_test, owner_id):
+    db_mock_test = models.MockTest(title=mock_test.title, description=mock_test.description, owner_id=owner_id)
+    db_listening_section = models.MockTestSection(title="listening")
+    db_reading_section = models.MockTestSection(title="reading", passage=mock_test.reading_section.passage)
+    db_writing_section = models.MockTestSection(
+        title="writing",
+        task1=mock_test.writing_section.task1,
+        task2=mock_test.writing_section.task2
+    )
+    db_mock_test.sections = [db_listening_section, db_reading_section, db_writing_section]
+    db.add(db_mock_test)
+    await db.flush()
+
+    await insert_questions(db, models.MockTestQuestion, mock_test.listening_section.questions, section_id=db_listening_section.id)
+    await insert_questions(db, models.MockTestQuestion, mock_test.reading_section.questions, section_id=db_reading_section.id)
+    await search.index(db, "mock_test", db_mock_test.id)
+    return db_mock_test
+
+def prefix_upper_bound(prefix):
+    # Smallest string greater than every string starting with prefix, so a
+    # prefix match can be a range scan on the index instead of LIKE.
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    # Rejected with 429 before any bcrypt work when over the rate or CPU limits
+    await admission.controller.admit(admission.client_ip(request))
+
     # Check if user exists first
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Validate input
-    if user.password != user.re_password:
-        raise HTTPException(status_code=400, detail="Passwords do not match")
-    if not user.email.endswith("@gmail.com"):
-        raise HTTPException(status_code=400, detail="Only Gmail addresses are allowed")
-    if len(user.password) < 8:
-        raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
-    if not any(c.isdigit() for c in user.password) or not any(c.isalpha() for c in user.password):
-        raise HTTPException(status_code=400, detail="Password must contain both letters and numbers")
+    error = auth.new_user_error(user.email, user.password, user.re_password)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
         
     # Create user
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     try:
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Failed to create user")
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    await admission.controller.admit(admission.client_ip(request), account=form_data.username)
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,279 +216,408 @@ async def read_users_me(current_user: schemas.User = Depends(auth.get_current_ac
 async def admin_only_endpoint(current_user: schemas.User = Depends(auth.get_current_admin_user)):
     return {"message": "Welcome, Admin!"}
 
-@app.get("/admin/users/", response_model=list[schemas.User])
-async def read_users(db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
-    users = db.query(models.User).all()
-    return users
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # Prometheus text format, scraped from inside the deployment network
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.get("/admin/stats/")
+async def read_stats(current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    return {
+        "password_hashing": auth.password_pool.stats(),
+        "admission": admission.controller.stats(),
+        "principal_cache": auth.principal_cache.stats(),
+        "answer_key_cache": grading.answer_key_cache.stats(),
+        "response_cache": responses.content_cache.stats(),
+        "leaderboards": leaderboards.stats(),
+        "user_import_hashing": user_import.import_pool.stats(),
+        "writing_feedback": writing.feedback_queue.stats(),
+        "database_pool": pool_stats(async_engine),
+    }
+
+@app.get("/admin/query-profiles/")
+async def read_query_profiles(current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    # Newest first; empty unless the profiler is enabled
+    return profiler.query_profiler.recent()
+
+@app.get("/admin/query-profiles/{profile_id}")
+async def read_query_profile(profile_id: int, current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    profile = profiler.query_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Query profile not found")
+    return profile
+
+@app.get("/admin/users/", response_model=schemas.UserPage)
+async def read_users(
+    role: Optional[str] = None,
+    email_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_admin_user),
+):
+    query = select(models.User)
+    if role:
+        query = query.where(models.User.role == role)
+    if email_prefix:
+        # Paged by email, the order the email index's range scan yields; paging
+        # by id would sort every matching user before returning the first page
+        query = query.where(models.User.email >= email_prefix, models.User.email < prefix_upper_bound(email_prefix))
+        return await paginate(db, query, models.User.email, cursor, limit)
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=422, detail="cursor must be a user id")
+    return await paginate(db, query, models.User.id, None if cursor is None else int(cursor), limit)
+
+@app.post("/admin/users/import", response_model=schemas.UserImportReport)
+async def import_users(request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    # Streams a text/csv or application/x-ndjson body; see app/user_import.py
+    return await user_import.import_users(db, user_import.read_rows(request))
 
 @app.get("/admin/users/{user_id}", response_model=schemas.User)
-async def read_user(user_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @app.put("/admin/users/{user_id}", response_model=schemas.User)
-async def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user(user_id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    db_user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    old_email = db_user.email
     if user.email:
         db_user.email = user.email
     if user.password:
-        db_user.hashed_password = auth.get_password_hash(user.password)
+        db_user.hashed_password = await auth.get_password_hash_async(user.password)
     if user.role:
         db_user.role = user.role
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    auth.invalidate_principal(old_email)
+    auth.invalidate_principal(db_user.email)
     return db_user
 
 @app.delete("/admin/users/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_admin_user)):
+    query = select(models.User).options(selectinload(models.User.quizzes), selectinload(models.User.mock_tests)).where(models.User.id == user_id)
+    db_user = await db.scalar(query)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(db_user)
-    db.commit()
+    await search.remove_owner(db, user_id)
+    await db.delete(db_user)
+    await db.commit()
+    auth.invalidate_principal(db_user.email)
     return {"message": "User deleted successfully"}
 
 # Quiz Management Endpoints
 @app.post("/quizzes/", response_model=schemas.Quiz)
-async def create_quiz(quiz: schemas.QuizCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_quiz = models.Quiz(title=quiz.title, description=quiz.description, owner_id=current_user.id)
-    db.add(db_quiz)
-    db.commit()
-    db.refresh(db_quiz)
-
-    for q_data in quiz.questions:
-        db_question = models.Question(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            quiz_id=db_quiz.id
-        )
-        db.add(db_question)
-    db.commit()
-    db.refresh(db_quiz)
-    return db_quiz
-
+async def create_quiz(quiz: schemas.QuizCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    # Quiz and questions are written in a single transaction
+    db_quiz = await add_quiz(db, quiz, current_user.id)
+    await db.commit()
+    responses.invalidate(("quizzes", current_user.id))
+    return await get_quiz(db, db_quiz.id, current_user.id)
+
+# The content reads are served from responses.content_cache as pre-serialised
+# (and pre-compressed) bytes with ETag and Last-Modified validators; the ORM
+# graph is only loaded on a miss.
 @app.get("/quizzes/", response_model=list[schemas.Quiz])
-async def read_quizzes(db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    quizzes = db.query(models.Quiz).filter(models.Quiz.owner_id == current_user.id).all()
-    return quizzes
+async def read_quizzes(request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    async def load():
+        return (await db.scalars(select(models.Quiz).options(*QUIZ_GRAPH).where(models.Quiz.owner_id == current_user.id))).all()
+    return await serve_content(
+        request, ("quizzes", current_user.id), current_user.id, list[schemas.Quiz],
+        load=load,
+        peek=lambda: peek_list(db, models.Quiz, "quizzes", current_user.id),
+        tag=lambda quizzes: tag_list("quizzes", current_user.id, quizzes),
+    )
 
 @app.get("/quizzes/{quiz_id}", response_model=schemas.Quiz)
-async def read_quiz(quiz_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.owner_id == current_user.id).first()
-    if quiz is None:
+async def read_quiz(quiz_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    response = await serve_content(
+        request, ("quiz", quiz_id), current_user.id, schemas.Quiz,
+        load=lambda: get_quiz(db, quiz_id, current_user.id),
+        peek=lambda: peek_item(db, models.Quiz, "quiz", quiz_id, current_user.id),
+        tag=lambda quiz: tag_item("quiz", quiz),
+    )
+    if response is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    return quiz
+    return response
 
 @app.put("/quizzes/{quiz_id}", response_model=schemas.Quiz)
-async def update_quiz(quiz_id: int, quiz: schemas.QuizCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.owner_id == current_user.id).first()
+async def update_quiz(quiz_id: int, quiz: schemas.QuizCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    db_quiz = await get_quiz(db, quiz_id, current_user.id)
     if db_quiz is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     db_quiz.title = quiz.title
     db_quiz.description = quiz.description
+    db_quiz.version += 1
+    db_quiz.updated_at = time.time()
     
     # Delete old questions and add new ones
-    db.query(models.Question).filter(models.Question.quiz_id == quiz_id).delete()
-    for q_data in quiz.questions:
-        db_question = models.Question(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            quiz_id=db_quiz.id
-        )
-        db.add(db_question)
+    await db.execute(delete(models.Question).where(models.Question.quiz_id == quiz_id))
+    await insert_questions(db, models.Question, quiz.questions, quiz_id=db_quiz.id)
+    await search.reindex(db, "quiz", quiz_id)
     
-    db.commit()
-    db.refresh(db_quiz)
+    await db.commit()
+    responses.invalidate(("quiz", quiz_id), ("quizzes", current_user.id))
+    await db.refresh(db_quiz, ["questions"])
     return db_quiz
 
 @app.delete("/quizzes/{quiz_id}")
-async def delete_quiz(quiz_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.owner_id == current_user.id).first()
+async def delete_quiz(quiz_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    db_quiz = await get_quiz(db, quiz_id, current_user.id)
     if db_quiz is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    db.delete(db_quiz)
-    db.commit()
+    await search.remove(db, "quiz", quiz_id)
+    await db.delete(db_quiz)
+    await db.commit()
+    responses.invalidate(("quiz", quiz_id), ("quizzes", current_user.id))
     return {"message": "Quiz deleted successfully"}
 
 # Mock Test Management Endpoints
 @app.post("/mock-tests/", response_model=schemas.MockTest)
-async def create_mock_test(mock_test: schemas.MockTestCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_mock_test = models.MockTest(title=mock_test.title, description=mock_test.description, owner_id=current_user.id)
-    db.add(db_mock_test)
-    db.commit()
-    db.refresh(db_mock_test)
-
-    # Add listening section
-    db_listening_section = models.MockTestSection(
-        title="listening",
-        mock_test_id=db_mock_test.id
-    )
-    db.add(db_listening_section)
-    db.commit()
-    db.refresh(db_listening_section)
-    for q_data in mock_test.listening_section.questions:
-        db_question = models.MockTestQuestion(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            section_id=db_listening_section.id
-        )
-        db.add(db_question)
-
-    # Add reading section
-    db_reading_section = models.MockTestSection(
-        title="reading",
-        passage=mock_test.reading_section.passage,
-        mock_test_id=db_mock_test.id
-    )
-    db.add(db_reading_section)
-    db.commit()
-    db.refresh(db_reading_section)
-    for q_data in mock_test.reading_section.questions:
-        db_question = models.MockTestQuestion(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            section_id=db_reading_section.id
-        )
-        db.add(db_question)
-
-    # Add writing section
-    db_writing_section = models.MockTestSection(
-        title="writing",
-        task1=mock_test.writing_section.task1,
-        task2=mock_test.writing_section.task2,
-        mock_test_id=db_mock_test.id
-    )
-    db.add(db_writing_section)
-    db.commit()
-    db.refresh(db_writing_section)
-
-    db.commit()
-    db.refresh(db_mock_test)
-    return db_mock_test
+async def create_mock_test(mock_test: schemas.MockTestCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    # The mock test, its sections and all questions are written in a single
+    # transaction; nothing is left behind if any insert fails.
+    db_mock_test = await add_mock_test(db, mock_test, current_user.id)
+    await db.commit()
+    responses.invalidate(("mock_tests", current_user.id))
+    return await get_mock_test(db, db_mock_test.id)
 
 @app.get("/mock-tests/", response_model=list[schemas.MockTest])
-async def read_mock_tests(db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    mock_tests = db.query(models.MockTest).filter(models.MockTest.owner_id == current_user.id).all()
-    return mock_tests
+async def read_mock_tests(request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    async def load():
+        return (await db.scalars(select(models.MockTest).options(*MOCK_TEST_GRAPH).where(models.MockTest.owner_id == current_user.id))).all()
+    return await serve_content(
+        request, ("mock_tests", current_user.id), current_user.id, list[schemas.MockTest],
+        load=load,
+        peek=lambda: peek_list(db, models.MockTest, "mock_tests", current_user.id),
+        tag=lambda mock_tests: tag_list("mock_tests", current_user.id, mock_tests),
+    )
 
 @app.get("/mock-tests/{test_id}", response_model=schemas.MockTest)
-async def read_mock_test(test_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    mock_test = db.query(models.MockTest).filter(models.MockTest.id == test_id, models.MockTest.owner_id == current_user.id).first()
-    if mock_test is None:
+async def read_mock_test(test_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    response = await serve_content(
+        request, ("mock_test", test_id), current_user.id, schemas.MockTest,
+        load=lambda: get_mock_test(db, test_id, current_user.id),
+        peek=lambda: peek_item(db, models.MockTest, "mock_test", test_id, current_user.id),
+        tag=lambda mock_test: tag_item("mock_test", mock_test),
+    )
+    if response is None:
         raise HTTPException(status_code=404, detail="Mock Test not found")
-    return mock_test
+    return response
 
 @app.put("/mock-tests/{test_id}", response_model=schemas.MockTest)
-async def update_mock_test(test_id: int, mock_test: schemas.MockTestCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_mock_test = db.query(models.MockTest).filter(models.MockTest.id == test_id, models.MockTest.owner_id == current_user.id).first()
+async def update_mock_test(test_id: int, mock_test: schemas.MockTestCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    db_mock_test = await get_mock_test(db, test_id, current_user.id)
     if db_mock_test is None:
         raise HTTPException(status_code=404, detail="Mock Test not found")
     
     db_mock_test.title = mock_test.title
     db_mock_test.description = mock_test.description
+    db_mock_test.version += 1
+    db_mock_test.updated_at = time.time()
 
     # Update sections and questions
+    await analytics.clear_question_stats(db, test_id)
     # Listening
-    db_listening_section = db.query(models.MockTestSection).filter(models.MockTestSection.mock_test_id == test_id, models.MockTestSection.title == "listening").first()
-    db.query(models.MockTestQuestion).filter(models.MockTestQuestion.section_id == db_listening_section.id).delete()
-    for q_data in mock_test.listening_section.questions:
-        db_question = models.MockTestQuestion(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            section_id=db_listening_section.id
-        )
-        db.add(db_question)
+    db_listening_section = db_mock_test.listening_section
+    await db.execute(delete(models.MockTestQuestion).where(models.MockTestQuestion.section_id == db_listening_section.id))
+    await insert_questions(db, models.MockTestQuestion, mock_test.listening_section.questions, section_id=db_listening_section.id)
 
     # Reading
-    db_reading_section = db.query(models.MockTestSection).filter(models.MockTestSection.mock_test_id == test_id, models.MockTestSection.title == "reading").first()
+    db_reading_section = db_mock_test.reading_section
     db_reading_section.passage = mock_test.reading_section.passage
-    db.query(models.MockTestQuestion).filter(models.MockTestQuestion.section_id == db_reading_section.id).delete()
-    for q_data in mock_test.reading_section.questions:
-        db_question = models.MockTestQuestion(
-            text=q_data.text,
-            options=json.dumps(q_data.options),
-            correct_answer=q_data.correct_answer,
-            section_id=db_reading_section.id
-        )
-        db.add(db_question)
+    await db.execute(delete(models.MockTestQuestion).where(models.MockTestQuestion.section_id == db_reading_section.id))
+    await insert_questions(db, models.MockTestQuestion, mock_test.reading_section.questions, section_id=db_reading_section.id)
 
     # Writing
-    db_writing_section = db.query(models.MockTestSection).filter(models.MockTestSection.mock_test_id == test_id, models.MockTestSection.title == "writing").first()
+    db_writing_section = db_mock_test.writing_section
     db_writing_section.task1 = mock_test.writing_section.task1
     db_writing_section.task2 = mock_test.writing_section.task2
+    await search.reindex(db, "mock_test", test_id)
 
-    db.commit()
-    db.refresh(db_mock_test)
-    return db_mock_test
+    await db.commit()
+    grading.invalidate_answer_key(test_id)
+    responses.invalidate(("mock_test", test_id), ("mock_tests", current_user.id))
+    db.expunge_all()
+    return await get_mock_test(db, test_id)
 
 @app.delete("/mock-tests/{test_id}")
-async def delete_mock_test(test_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
-    db_mock_test = db.query(models.MockTest).filter(models.MockTest.id == test_id, models.MockTest.owner_id == current_user.id).first()
+async def delete_mock_test(test_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    db_mock_test = await get_mock_test(db, test_id, current_user.id)
     if db_mock_test is None:
         raise HTTPException(status_code=404, detail="Mock Test not found")
-    db.delete(db_mock_test)
-    db.commit()
+    await analytics.clear(db, test_id)
+    await search.remove(db, "mock_test", test_id)
+    await db.delete(db_mock_test)
+    await db.commit()
+    grading.invalidate_answer_key(test_id)
+    leaderboards.invalidate(test_id)
+    responses.invalidate(("mock_test", test_id), ("mock_tests", current_user.id))
     return {"message": "Mock Test deleted successfully"}
 
+@app.get("/search", response_model=schemas.SearchPage)
+async def search_content(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = Query(None, pattern="^(quiz|mock_test)$"),
+    cursor: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_teacher_user),
+):
+    # Ranked full-text search over the teacher's own questions, passages and
+    # writing tasks; see app/search.py
+    return await search.search(db, current_user.id, q, item_type=kind, cursor=cursor, limit=limit)
+
+# Question bank: whole quizzes and mock tests as NDJSON, streamed both ways;
+# see app/question_bank.py
+@app.post("/question-bank/import", response_model=schemas.QuestionBankImportReport)
+async def import_question_bank(request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    if streams.content_type(request) not in streams.NDJSON_TYPES:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Upload the question bank as application/x-ndjson")
+    adders = {"quiz": add_quiz, "mock_test": add_mock_test}
+
+    async def add(kind, item):
+        await adders[kind](db, item, current_user.id)
+
+    try:
+        return await question_bank.import_items(db, streams.lines(request.stream()), add)
+    finally:
+        # Chunks committed before any failure are visible too
+        responses.invalidate(("quizzes", current_user.id), ("mock_tests", current_user.id))
+
+@app.get("/question-bank/export")
+async def export_question_bank(
+    kind: Optional[str] = Query(None, pattern="^(quiz|mock_test)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_teacher_user),
+):
+    kinds = [kind] if kind else list(question_bank.SCHEMAS)
+    return StreamingResponse(question_bank.export_items(db, current_user.id, kinds), media_type=streams.NDJSON_TYPE)
+
 @app.post("/mock-tests/{test_id}/submit")
-async def submit_mock_test(test_id: int, submission: schemas.MockTestSubmission, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
-    mock_test = db.query(models.MockTest).filter(models.MockTest.id == test_id).first()
-    if mock_test is None:
+async def submit_mock_test(test_id: int, submission: schemas.MockTestSubmission, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
+    # Grade Listening and Reading against the compiled answer key (cached, so
+    # usually no DB reads at all)
+    answer_key = await grading.get_answer_key(db, test_id)
+    if answer_key is None:
         raise HTTPException(status_code=404, detail="Mock Test not found")
 
-    listening_score = 0
-    reading_score = 0
-
-    # Grade Listening Section
-    listening_section = db.query(models.MockTestSection).filter(models.MockTestSection.mock_test_id == test_id, models.MockTestSection.title == "listening").first()
-    if listening_section and "listening" in submission.answers:
-        for question in listening_section.questions:
-            if str(question.id) in submission.answers["listening"] and submission.answers["listening"][str(question.id)] == question.correct_answer:
-                listening_score += 1
-
-    # Grade Reading Section
-    reading_section = db.query(models.MockTestSection).filter(models.MockTestSection.mock_test_id == test_id, models.MockTestSection.title == "reading").first()
-    if reading_section and "reading" in submission.answers:
-        for question in reading_section.questions:
-            if str(question.id) in submission.answers["reading"] and submission.answers["reading"][str(question.id)] == question.correct_answer:
-                reading_score += 1
-
-    # Grade Writing Section using Gemini API
-    writing_feedback = None
+    listening_score = answer_key.score("listening", submission.answers.get("listening"))
+    reading_score = answer_key.score("reading", submission.answers.get("reading"))
+    await analytics.record_answers(db, answer_key, submission.answers)
+
+    # Writing is evaluated by the grader in the background; poll
+    # /writing-feedback/{job_id} for the result
+    job = None
     if "writing" in submission.answers:
-        task1_answer = submission.answers["writing"].get("task1", "")
-        task2_answer = submission.answers["writing"].get("task2", "")
-        
-        # Placeholder for Gemini API call
-        # In a real application, you would send task1_answer and task2_answer to Gemini API
-        # and get feedback and suggestions.
-        writing_feedback = {
-            "task1_feedback": "This is a placeholder feedback for Task 1 from Gemini API.",
-            "task2_feedback": "This is a placeholder feedback for Task 2 from Gemini API.",
-            "overall_suggestion": "Overall placeholder suggestion from Gemini API."
-        }
+        job = models.WritingFeedbackJob(
+            mock_test_id=test_id,
+            user_id=current_user.id,
+            task1_answer=submission.answers["writing"].get("task1", ""),
+            task2_answer=submission.answers["writing"].get("task2", ""),
+        )
+        db.add(job)
+    await db.commit()
+    writing_feedback_job_id = None
+    if job is not None:
+        writing_feedback_job_id = job.id
+        writing.feedback_queue.enqueue(job.id)
 
     return {
         "message": "Mock test submitted successfully",
         "listening_score": listening_score,
         "reading_score": reading_score,
-        "total_questions_listening": len(listening_section.questions) if listening_section else 0,
-        "total_questions_reading": len(reading_section.questions) if reading_section else 0,
-        "writing_feedback": writing_feedback
+        "total_questions_listening": answer_key.total("listening"),
+        "total_questions_reading": answer_key.total("reading"),
+        "writing_feedback": None,
+        "writing_feedback_job_id": writing_feedback_job_id
     }
 
+@app.get("/writing-feedback/{job_id}", response_model=schemas.WritingFeedbackJob)
+async def read_writing_feedback(job_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
+    job = await db.scalar(select(models.WritingFeedbackJob).where(models.WritingFeedbackJob.id == job_id, models.WritingFeedbackJob.user_id == current_user.id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Writing feedback job not found")
+    return job
+
+@app.post("/mock-tests/{test_id}/grade-batch")
+async def grade_mock_test_batch(test_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    # A schemas.BatchGradeRequest body, parsed and validated in one pass:
+    # FastAPI's json.loads followed by validation takes longer than the grading
+    try:
+        batch = schemas.BatchGradeRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+    owned = await db.scalar(select(models.MockTest.id).where(models.MockTest.id == test_id, models.MockTest.owner_id == current_user.id))
+    answer_key = await grading.get_answer_key(db, test_id) if owned else None
+    if answer_key is None:
+        raise HTTPException(status_code=404, detail="Mock Test not found")
+    if any(submission.test_id != test_id for submission in batch.submissions):
+        raise HTTPException(status_code=400, detail="All submissions must be for this mock test")
+
+    graded = grading.grade_batch(answer_key, [submission.answers for submission in batch.submissions])
+    listening, reading = graded["listening"], graded["reading"]
+    listening_scores, reading_scores = listening["scores"].tolist(), reading["scores"].tolist()
+    # Rows stay NumPy arrays; orjson writes them out directly
+    listening_correct, reading_correct = listening["correct"].astype("u1"), reading["correct"].astype("u1")
+    results = [
+        {
+            "user_id": submission.user_id,
+            "listening_score": listening_scores[row],
+            "reading_score": reading_scores[row],
+            "listening_correct": listening_correct[row],
+            "reading_correct": reading_correct[row],
+        }
+        for row, submission in enumerate(batch.submissions)
+    ]
+    # Built by hand and returned directly: jsonable_encoder is far too slow for
+    # tens of thousands of rows
+    return ORJSONResponse({
+        "question_ids": {"listening": listening["question_ids"], "reading": reading["question_ids"]},
+        "total_questions_listening": answer_key.total("listening"),
+        "total_questions_reading": answer_key.total("reading"),
+        "results": results,
+    })
+
+@app.get("/mock-tests/{test_id}/analytics", response_model=schemas.MockTestAnalytics)
+async def read_mock_test_analytics(test_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_teacher_user)):
+    owned = await db.scalar(select(models.MockTest.id).where(models.MockTest.id == test_id, models.MockTest.owner_id == current_user.id))
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Mock Test not found")
+    return await analytics.read_analytics(db, test_id)
+
+@app.get("/mock-tests/{test_id}/leaderboard", response_model=schemas.Leaderboard)
+async def read_leaderboard(
+    test_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+):
+    # Served from the in-memory board; the DB is only read to build it and to
+    # pick up results stored by other workers
+    board = await leaderboards.get(db, test_id)
+    if board is None:
+        raise HTTPException(status_code=404, detail="Mock Test not found")
+    return {"mock_test_id": test_id, "total": len(board), "entries": board.top(limit), "me": board.rank(current_user.id)}
+
 @app.post("/test-results/", response_model=schemas.TestResult)
-async def create_test_result(test_result: schemas.TestResultCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
+async def create_test_result(test_result: schemas.TestResultCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
+    # The scores come from the client but feed the analytics and leaderboards,
+    # so they must be possible on this mock test
+    answer_key = await grading.get_answer_key(db, test_result.mock_test_id)
+    if answer_key is None:
+        raise HTTPException(status_code=404, detail="Mock Test not found")
+    for section in grading.GRADED_SECTIONS:
+        total = answer_key.total(section)
+        if getattr(test_result, f"total_questions_{section}") != total:
+            raise HTTPException(status_code=422, detail=f"total_questions_{section} must be {total} for this mock test")
+        if not 0 <= getattr(test_result, f"{section}_score") <= total:
+            raise HTTPException(status_code=422, detail=f"{section}_score must be between 0 and {total}")
     db_test_result = models.TestResult(
         mock_test_id=test_result.mock_test_id,
         user_id=current_user.id,
@@ -367,14 +628,24 @@ async def create_test_result(test_result: schemas.TestResultCreate, db: Session
         total_questions_reading=test_result.total_questions_reading
     )
     db.add(db_test_result)
-    db.commit()
-    db.refresh(db_test_result)
+    await analytics.record_result(db, db_test_result)
+    await db.commit()
+    await db.refresh(db_test_result)
+    leaderboards.record(db_test_result)
     return db_test_result
 
-@app.get("/test-results/me/", response_model=list[schemas.TestResult])
-async def read_my_test_results(db: Session = Depends(get_db), current_user: schemas.User = Depends(auth.get_current_active_user)):
-    test_results = db.query(models.TestResult).filter(models.TestResult.user_id == current_user.id).all()
-    return test_results
+@app.get("/test-results/me/", response_model=schemas.TestResultPage)
+async def read_my_test_results(
+    mock_test_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+):
+    query = select(models.TestResult).where(models.TestResult.user_id == current_user.id)
+    if mock_test_id is not None:
+        query = query.where(models.TestResult.mock_test_id == mock_test_id)
+    return await paginate(db, query, models.TestResult.id, cursor, limit)
 
 @app.get("/")
 def read_root():
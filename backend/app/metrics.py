@@ -0,0 +1,129 @@
+"""Per-route request metrics, exported in Prometheus text format on /metrics.
+
+``MetricsMiddleware`` times every request and labels it with the matched route
+template (``/mock-tests/{test_id}``, never the raw path), so label cardinality
+is bounded by the number of routes. Work done on behalf of a request (SQL
+statements and password hashing) is accumulated in a ``RequestStats`` held in
+a context variable and recorded when the response finishes.
+
+Metrics are per process; with several uvicorn workers each scrape sees the
+worker that served it.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST  # noqa: F401 -- re-exported for the /metrics route
+from sqlalchemy import event
+
+UNMATCHED_ROUTE = "<unmatched>"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+registry = CollectorRegistry()
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+requests_total = Counter(
+    "http_requests", "Responses by route template and status code",
+    ["method", "route", "status"], registry=registry,
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "Requests being served (routes are only known once a request is matched)",
+    ["method"], registry=registry,
+)
+db_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    ["method", "route"], buckets=QUERY_COUNT_BUCKETS, registry=registry,
+)
+db_duration = Histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per request",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+password_hash_duration = Histogram(
+    "http_request_password_hash_duration_seconds", "Time spent hashing or verifying passwords per request, when any",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    password_hash_seconds: float = 0.0
+
+current_request = ContextVar("current_request", default=None)
+
+@contextmanager
+def time_password_hash():
+    stats = current_request.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.password_hash_seconds += time.perf_counter() - start
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    starts = conn.info.get("metrics_query_start")
+    if stats is not None and starts:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - starts.pop()
+
+def instrument_engine(target_engine):
+    """Count and time the statements ``target_engine`` (sync or async) runs for requests."""
+    sync_engine = getattr(target_engine, "sync_engine", target_engine)
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+def route_label(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task, unlike BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        in_flight = requests_in_flight.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            current_request.reset(token)
+            route = route_label(scope)
+            request_duration.labels(method, route).observe(elapsed)
+            requests_total.labels(method, route, str(status_code)).inc()
+            db_queries.labels(method, route).observe(stats.queries)
+            db_duration.labels(method, route).observe(stats.db_seconds)
+            if stats.password_hash_seconds:
+                password_hash_duration.labels(method, route).observe(stats.password_hash_seconds)
+
+def render():
+    return generate_latest(registry)
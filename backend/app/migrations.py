@@ -0,0 +1,162 @@
+"""Versioned schema migrations.
+
+Run once per deploy, before starting the workers:
+
+    python -m app.migrations            # upgrade to the latest version
+    python -m app.migrations --status   # show applied and pending versions
+
+Each migration runs in its own transaction and is recorded in the
+``schema_migrations`` table. Version 1 creates any missing tables from the
+models, so every later migration must be idempotent: safe against both an
+older database and a fresh one whose tables were created from newer models.
+"""
+import argparse
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+
+from . import models  # noqa: F401 -- registers the tables on Base.metadata
+from .database import Base, engine
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", Float),
+)
+
+# Helpers for writing idempotent migrations
+
+def has_column(conn, table, column):
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+def has_index(conn, table, index):
+    return any(i["name"] == index for i in inspect(conn).get_indexes(table))
+
+def create_indexes(conn, *names):
+    """Create the named model indexes that do not exist yet."""
+    indexes = {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        index = indexes[name]
+        if not has_index(conn, index.table.name, name):
+            index.create(conn)
+
+@migration(1, "Initial schema")
+def initial_schema(conn):
+    Base.metadata.create_all(conn, checkfirst=True)
+
+@migration(2, "Indexes for the owner, section, question and result access paths")
+def access_path_indexes(conn):
+    create_indexes(
+        conn,
+        "ix_users_role_id",
+        "ix_quizzes_owner_id",
+        "ix_questions_quiz_id",
+        "ix_mock_tests_owner_id",
+        "ix_mock_test_sections_mock_test_id_title",
+        "ix_mock_test_questions_section_id_id_answer",
+        "ix_test_results_user_id_mock_test_id_id",
+    )
+
+@migration(3, "Store question options as JSON")
+def options_as_json(conn):
+    # SQLite keeps JSON columns as the same text the old String columns held,
+    # so only Postgres needs its rows converted
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("questions", "mock_test_questions"):
+        column = next(c for c in inspect(conn).get_columns(table) if c["name"] == "options")
+        if not isinstance(column["type"], JSONB):
+            conn.exec_driver_sql(f"ALTER TABLE {table} ALTER COLUMN options TYPE JSONB USING options::jsonb")
+
+@migration(4, "Version and last-modified time on quizzes and mock tests")
+def content_versions(conn):
+    now = time.time()
+    for table in ("quizzes", "mock_tests"):
+        if not has_column(conn, table, "version"):
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        if not has_column(conn, table, "updated_at"):
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN updated_at FLOAT")
+        conn.execute(text(f"UPDATE {table} SET updated_at = :now WHERE updated_at IS NULL"), {"now": now})
+
+@migration(5, "Mock-test analytics tables, backfilled from existing results")
+def analytics_tables(conn):
+    from . import analytics
+    tables = [models.MockTestScoreBucket.__table__, models.MockTestQuestionStat.__table__]
+    Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+    analytics.backfill(conn)
+
+@migration(6, "Index test results by mock test for the leaderboards")
+def leaderboard_index(conn):
+    create_indexes(conn, "ix_test_results_mock_test_id_id")
+
+@migration(7, "Full-text search index over quizzes and mock tests")
+def search_index(conn):
+    from . import search
+    search.create_index(conn)
+    search.rebuild(conn)
+
+@migration(8, "Claim time on writing-feedback jobs, so unfinished jobs are recovered")
+def writing_feedback_claims(conn):
+    if not has_column(conn, "writing_feedback_jobs", "claimed_at"):
+        conn.exec_driver_sql("ALTER TABLE writing_feedback_jobs ADD COLUMN claimed_at FLOAT")
+    create_indexes(conn, "ix_writing_feedback_jobs_status_claimed_at")
+
+@migration(9, "Drop the single-column test-results user index")
+def drop_test_results_user_index(conn):
+    # Only databases created from the models between versions 1 and 2 have it;
+    # ix_test_results_user_id_mock_test_id_id serves the same lookups
+    if has_index(conn, "test_results", "ix_test_results_user_id"):
+        conn.exec_driver_sql("DROP INDEX ix_test_results_user_id")
+
+@migration(10, "Index test results by user and id for the unfiltered results page")
+def test_results_user_page_index(conn):
+    create_indexes(conn, "ix_test_results_user_id_id")
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+def migrate(target_engine=engine, log=print):
+    """Apply every pending migration; returns the versions applied."""
+    applied = []
+    with target_engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, description, func in MIGRATIONS:
+        if version in done:
+            continue
+        with target_engine.begin() as conn:
+            # Re-check inside the transaction in case another runner got here first
+            if version in applied_versions(conn):
+                continue
+            log(f"Applying migration {version}: {description}")
+            func(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description, applied_at=time.time()))
+        applied.append(version)
+    return applied
+
+def status(target_engine=engine):
+    with target_engine.begin() as conn:
+        done = applied_versions(conn)
+    return [(version, description, version in done) for version, description, _ in MIGRATIONS]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+    if args.status:
+        for version, description, is_applied in status():
+            print(f"{version:>4}  {'applied' if is_applied else 'pending'}  {description}")
+    elif not migrate():
+        print("Database schema is up to date")
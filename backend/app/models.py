@@ -1,7 +1,14 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Float, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
+import time
+
+# Question options are a list of strings, decoded as rows load so the schemas
+# receive ready-made lists: SQLAlchemy's JSON type runs json.loads on each row
+# on SQLite, and the driver's JSONB codec decodes them on Postgres
+OptionList = JSON().with_variant(JSONB(), "postgresql")
 
 class UserRole(str, enum.Enum):
     student = "student"
@@ -10,6 +17,10 @@ class UserRole(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Admin listing filtered by role, paged by id
+        Index("ix_users_role_id", "role", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -20,32 +31,36 @@ class User(Base):
     quizzes = relationship("Quiz", back_populates="owner")
     mock_tests = relationship("MockTest", back_populates="owner")
 
+# Content collections are loaded explicitly by the routes (see QUIZ_GRAPH and
+# MOCK_TEST_GRAPH in main.py); an accidental lazy load raises instead of
+# silently issuing one query per row.
 class Quiz(Base):
     __tablename__ = "quizzes"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, default=1, nullable=False) # Bumped by update_quiz; part of the ETag
+    updated_at = Column(Float, default=time.time) # Unix time, sent as Last-Modified
 
     owner = relationship("User", back_populates="quizzes")
-    questions = relationship("Question", back_populates="quiz")
+    questions = relationship("Question", back_populates="quiz", lazy="raise")
 
 class Question(Base):
     __tablename__ = "questions"
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String)
-    options = Column(String) # Storing as JSON string for simplicity
+    options = Column(OptionList)
     correct_answer = Column(String)
-    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
 
     quiz = relationship("Quiz", back_populates="questions")
     
     @property
     def options_list(self):
-        import json
-        return json.loads(self.options)
+        return self.options
 
 class MockTest(Base):
     __tablename__ = "mock_tests"
@@ -53,13 +68,34 @@ class MockTest(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, default=1, nullable=False) # Bumped by update_mock_test; part of the ETag
+    updated_at = Column(Float, default=time.time) # Unix time, sent as Last-Modified
 
     owner = relationship("User", back_populates="mock_tests")
-    sections = relationship("MockTestSection", back_populates="mock_test")
+    sections = relationship("MockTestSection", back_populates="mock_test", lazy="raise")
+
+    def get_section(self, title):
+        return next((section for section in self.sections if section.title == title), None)
+
+    @property
+    def listening_section(self):
+        return self.get_section("listening")
+
+    @property
+    def reading_section(self):
+        return self.get_section("reading")
+
+    @property
+    def writing_section(self):
+        return self.get_section("writing")
 
 class MockTestSection(Base):
     __tablename__ = "mock_test_sections"
+    __table_args__ = (
+        # Sections are always looked up by test, usually by title as well
+        Index("ix_mock_test_sections_mock_test_id_title", "mock_test_id", "title"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True) # listening, reading, writing
@@ -69,14 +105,18 @@ class MockTestSection(Base):
     mock_test_id = Column(Integer, ForeignKey("mock_tests.id"))
 
     mock_test = relationship("MockTest", back_populates="sections")
-    questions = relationship("MockTestQuestion", back_populates="section")
+    questions = relationship("MockTestQuestion", back_populates="section", lazy="raise")
 
 class MockTestQuestion(Base):
     __tablename__ = "mock_test_questions"
+    __table_args__ = (
+        # Covers the answer-key query, so grading never reads the question rows
+        Index("ix_mock_test_questions_section_id_id_answer", "section_id", "id", "correct_answer"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String)
-    options = Column(String) # Storing as JSON string for simplicity
+    options = Column(OptionList)
     correct_answer = Column(String)
     section_id = Column(Integer, ForeignKey("mock_test_sections.id"))
 
@@ -84,6 +124,13 @@ class MockTestQuestion(Base):
 
 class TestResult(Base):
     __tablename__ = "test_results"
+    __table_args__ = (
+        # A user's results, all of them or for one test, paged by id
+        Index("ix_test_results_user_id_id", "user_id", "id"),
+        Index("ix_test_results_user_id_mock_test_id_id", "user_id", "mock_test_id", "id"),
+        # A test's results in insertion order, read by the leaderboards
+        Index("ix_test_results_mock_test_id_id", "mock_test_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     mock_test_id = Column(Integer, ForeignKey("mock_tests.id"))
@@ -95,4 +142,48 @@ class TestResult(Base):
     total_questions_reading = Column(Integer)
 
     mock_test = relationship("MockTest")
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class WritingFeedbackJob(Base):
+    __tablename__ = "writing_feedback_jobs"
+    __table_args__ = (
+        # Unfinished jobs whose claim has lapsed, for FeedbackJobQueue.recover
+        Index("ix_writing_feedback_jobs_status_claimed_at", "status", "claimed_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    mock_test_id = Column(Integer, ForeignKey("mock_tests.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(String, default="queued") # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    task1_answer = Column(String, nullable=True)
+    task2_answer = Column(String, nullable=True)
+    feedback = Column(String, nullable=True) # Storing as JSON string
+    error = Column(String, nullable=True)
+    claimed_at = Column(Float, nullable=True) # When a worker last took or worked on the job
+
+class WritingFeedbackCacheEntry(Base):
+    __tablename__ = "writing_feedback_cache"
+
+    key = Column(String, primary_key=True) # sha256 of mock test, task, prompt and normalised answer
+    feedback = Column(String) # Storing as JSON string
+    hits = Column(Integer, default=0)
+    last_used = Column(Float, index=True)
+
+# Incrementally maintained analytics, see analytics.py
+class MockTestScoreBucket(Base):
+    __tablename__ = "mock_test_score_buckets"
+
+    mock_test_id = Column(Integer, ForeignKey("mock_tests.id"), primary_key=True)
+    section = Column(String, primary_key=True) # listening, reading
+    score = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False) # Results with this score
+
+class MockTestQuestionStat(Base):
+    __tablename__ = "mock_test_question_stats"
+
+    question_id = Column(Integer, ForeignKey("mock_test_questions.id"), primary_key=True)
+    mock_test_id = Column(Integer, ForeignKey("mock_tests.id"), index=True)
+    section = Column(String)
+    attempts = Column(Integer, default=0, nullable=False)
+    correct = Column(Integer, default=0, nullable=False)
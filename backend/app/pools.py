@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+def process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+class WorkerPool:
+    """Runs blocking, CPU-bound calls off the event loop on a bounded pool.
+
+    At most ``max_workers`` calls run at once; the rest wait in the executor
+    queue. ``kind`` is "thread" (for code that releases the GIL, like bcrypt)
+    or "process". Process workers are started by a forkserver (spawned where
+    that is unavailable), never forked from the server: a fork would copy its
+    event loop, open database connections and any lock another thread held.
+    """
+
+    def __init__(self, max_workers=None, kind="thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.kind = kind
+        self._executor = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=process_context())
+        return self._executor
+
+    @property
+    def queue_depth(self):
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = loop.time()
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += loop.time() - start
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": max(0, self.peak_in_flight - self.max_workers),
+            "completed": self.completed,
+            "total_seconds": round(self.total_seconds, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
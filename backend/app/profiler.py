@@ -0,0 +1,212 @@
+"""Opt-in SQL profiler: slow-query log, N+1 detection and per-request query timelines.
+
+Off unless QUERY_PROFILER=1, as it keeps every statement a request runs.
+Once enabled:
+
+* statements slower than SLOW_QUERY_MS (default 100) are logged on the
+  ``app.sql`` logger with the route that ran them. Parameter values are never
+  logged or kept (they carry emails, password hashes and answers), only how
+  many there were.
+* a request that runs one statement shape N_PLUS_ONE_THRESHOLD (default 10)
+  times or more is logged as a likely N+1. Shapes ignore parameter values and
+  the length of expanded IN lists, so ``WHERE id = ?`` in a loop is caught.
+* every response carries an ``X-Query-Profile`` id. The last
+  QUERY_PROFILE_HISTORY (default 200) requests are kept per process; admins
+  read one's query timeline at /admin/query-profiles/{id} and a summary of
+  all of them at /admin/query-profiles/.
+"""
+import itertools
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from .metrics import route_label
+
+logger = logging.getLogger("app.sql")
+
+PROFILE_HEADER = b"x-query-profile"
+MAX_TIMELINE = 1000 # Statements kept per request; later ones are only counted
+
+PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|\?")
+PLACEHOLDER_GROUP = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+REPEATED_GROUPS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+
+def statement_shape(statement):
+    """``statement`` with whitespace collapsed and every placeholder list reduced to ``(?...)``."""
+    shape = PLACEHOLDER.sub("?", " ".join(statement.split()))
+    shape = PLACEHOLDER_GROUP.sub("(?...)", shape)
+    # Multi-row VALUES lists
+    return REPEATED_GROUPS.sub("(?...)", shape)
+
+def parameter_count(parameters, executemany):
+    if not parameters:
+        return 0
+    if executemany:
+        return sum(len(row) for row in parameters)
+    return len(parameters)
+
+class Profile:
+    """The statements one request ran, in order."""
+
+    def __init__(self, profile_id, scope):
+        self.id = profile_id
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.status = None
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.queries = 0
+        self.db_ms = 0.0
+        self.shapes = Counter()
+        self.timeline = []
+
+    @property
+    def route(self):
+        return route_label(self.scope)
+
+    def add(self, statement, parameters, executemany, start, end):
+        duration_ms = (end - start) * 1000
+        self.queries += 1
+        self.db_ms += duration_ms
+        self.shapes[statement_shape(statement)] += 1
+        if len(self.timeline) < MAX_TIMELINE:
+            self.timeline.append({
+                "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round(duration_ms, 3),
+                "statement": statement,
+                "parameters": parameter_count(parameters, executemany),
+                "executemany": executemany,
+            })
+
+    def repeated(self, threshold):
+        return [{"statement": shape, "count": count} for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self, threshold):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "queries": self.queries,
+            "db_ms": round(self.db_ms, 3),
+            "repeated": self.repeated(threshold),
+        }
+
+current_profile = ContextVar("current_profile", default=None)
+
+class QueryProfiler:
+    def __init__(self, enabled, slow_query_ms, n_plus_one_threshold, history):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+
+    def start(self, scope):
+        profile = Profile(next(self._ids), scope)
+        return profile, current_profile.set(profile)
+
+    def finish(self, profile, token, status):
+        current_profile.reset(token)
+        profile.status = status
+        profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 3)
+        for repeat in profile.repeated(self.n_plus_one_threshold):
+            logger.warning(
+                "Possible N+1 in %s %s (profile %d): %d x %s",
+                profile.method, profile.route, profile.id, repeat["count"], repeat["statement"],
+            )
+        self._history.append(profile)
+
+    def record(self, statement, parameters, executemany, start, end):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add(statement, parameters, executemany, start, end)
+        duration_ms = (end - start) * 1000
+        if duration_ms >= self.slow_query_ms:
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s [%d parameters redacted]",
+                duration_ms,
+                f"{profile.method} {profile.route}" if profile is not None else "<no request>",
+                " ".join(statement.split()),
+                parameter_count(parameters, executemany),
+            )
+
+    def recent(self):
+        return [profile.summary(self.n_plus_one_threshold) for profile in reversed(self._history)]
+
+    def get(self, profile_id):
+        """A kept request's summary and query timeline, or None."""
+        for profile in self._history:
+            if profile.id == profile_id:
+                return {**profile.summary(self.n_plus_one_threshold), "timeline": profile.timeline}
+        return None
+
+def configure(enabled=None, slow_query_ms=None, n_plus_one_threshold=None, history=None):
+    """Replace the global profiler, e.g. to switch it on in a test."""
+    global query_profiler
+    query_profiler = QueryProfiler(
+        enabled=os.getenv("QUERY_PROFILER", "0") == "1" if enabled is None else enabled,
+        slow_query_ms=float(os.getenv("SLOW_QUERY_MS", "100")) if slow_query_ms is None else slow_query_ms,
+        n_plus_one_threshold=n_plus_one_threshold or int(os.getenv("N_PLUS_ONE_THRESHOLD", "10")),
+        history=history or int(os.getenv("QUERY_PROFILE_HISTORY", "200")),
+    )
+    return query_profiler
+
+query_profiler = configure()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if query_profiler.enabled:
+        conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("profiler_query_start")
+    if starts:
+        query_profiler.record(statement, parameters, executemany, starts.pop(), time.perf_counter())
+
+def handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    starts = connection.info.get("profiler_query_start") if connection is not None else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(target_engine):
+    """Profile the statements ``target_engine`` (sync or async) runs while the profiler is enabled."""
+    sync_engine = getattr(target_engine, "sync_engine", target_engine)
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware giving each request a ``Profile`` while the profiler is enabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = query_profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        profile, token = profiler.start(scope)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (PROFILE_HEADER, str(profile.id).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.finish(profile, token, status_code)
@@ -0,0 +1,150 @@
+"""Streaming NDJSON import and export of a teacher's quizzes and mock tests.
+
+Each line holds one quiz or mock test with everything in it. The line is the
+POST /quizzes/ or POST /mock-tests/ body plus a ``type``:
+
+    {"type": "quiz", "title": ..., "description": ..., "questions": [{"text": ..., "options": [...], "correct_answer": ...}]}
+    {"type": "mock_test", "title": ..., "description": ...,
+     "listening_section": {"title": "listening", "questions": [...]},
+     "reading_section": {"title": "reading", "passage": ..., "questions": [...]},
+     "writing_section": {"title": "writing", "task1": ..., "task2": ...}}
+
+An export is valid import input, so a bank moves between instances with
+GET /question-bank/export and POST /question-bank/import.
+
+Both directions hold one item at a time, so memory stays flat however large
+the bank. The import parses the upload line by line. It commits every
+QUESTION_BANK_CHUNK_SIZE items and clears the session between chunks. The
+export reads one joined row per question from a server-side cursor, and
+writes each item out as soon as its last row has been read.
+"""
+import json
+import os
+
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from . import models, schemas
+
+IMPORT_CHUNK_SIZE = int(os.getenv("QUESTION_BANK_CHUNK_SIZE", "50"))
+EXPORT_BATCH_SIZE = int(os.getenv("QUESTION_BANK_EXPORT_BATCH_SIZE", "1000")) # Rows per cursor fetch
+SCHEMAS = {"quiz": schemas.QuizCreate, "mock_test": schemas.MockTestCreate}
+
+def parse_item(line):
+    """``(type, validated create schema)`` for one line; raises ValueError saying what is wrong."""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    kind = data.pop("type", None)
+    if kind not in SCHEMAS:
+        raise ValueError("type must be quiz or mock_test")
+    try:
+        return kind, SCHEMAS[kind].model_validate(data)
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise ValueError(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}")
+
+async def import_items(db, lines, add, chunk_size=None):
+    """Add every valid line of ``lines`` with ``await add(type, item)``, committing in chunks.
+
+    Returns counts by type and the rejected lines; a bad line never stops the
+    import.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    counts = {kind: 0 for kind in SCHEMAS}
+    errors = []
+    pending = 0
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            kind, item = parse_item(line)
+        except ValueError as e:
+            errors.append({"line": line_number, "detail": str(e)})
+            continue
+        await add(kind, item)
+        counts[kind] += 1
+        pending += 1
+        if pending >= chunk_size:
+            await db.commit()
+            db.expunge_all()
+            pending = 0
+    if pending:
+        await db.commit()
+    return {"quizzes": counts["quiz"], "mock_tests": counts["mock_test"], "failed": len(errors), "errors": errors}
+
+def dump(item):
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+def question(text, options, correct_answer):
+    return {"text": text, "options": options, "correct_answer": correct_answer}
+
+async def export_quizzes(db, owner_id):
+    quiz, item_question = models.Quiz, models.Question
+    query = (
+        select(quiz.id, quiz.title, quiz.description, item_question.id, item_question.text, item_question.options, item_question.correct_answer)
+        .outerjoin(item_question, item_question.quiz_id == quiz.id)
+        .where(quiz.owner_id == owner_id)
+        .order_by(quiz.id, item_question.id)
+    )
+    item, current_id = None, None
+    rows = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for quiz_id, title, description, question_id, text, options, correct_answer in rows:
+        if quiz_id != current_id:
+            if item is not None:
+                yield dump(item)
+            item, current_id = {"type": "quiz", "title": title, "description": description, "questions": []}, quiz_id
+        if question_id is not None:
+            item["questions"].append(question(text, options, correct_answer))
+    if item is not None:
+        yield dump(item)
+
+async def export_mock_tests(db, owner_id):
+    mock_test, section, section_question = models.MockTest, models.MockTestSection, models.MockTestQuestion
+    query = (
+        select(
+            mock_test.id, mock_test.title, mock_test.description,
+            section.title, section.passage, section.task1, section.task2,
+            section_question.id, section_question.text, section_question.options, section_question.correct_answer,
+        )
+        .join(section, section.mock_test_id == mock_test.id)
+        .outerjoin(section_question, section_question.section_id == section.id)
+        .where(mock_test.owner_id == owner_id)
+        .order_by(mock_test.id, section.id, section_question.id)
+    )
+    item, current_id = None, None
+    rows = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for test_id, title, description, section_title, passage, task1, task2, question_id, text, options, correct_answer in rows:
+        if test_id != current_id:
+            if item is not None:
+                yield dump(item)
+            item, current_id = {"type": "mock_test", "title": title, "description": description}, test_id
+        key = f"{section_title}_section"
+        if key not in item:
+            item[key] = {"title": section_title, "passage": passage, "task1": task1, "task2": task2}
+            if section_title != "writing":
+                item[key]["questions"] = []
+        if question_id is not None:
+            item[key]["questions"].append(question(text, options, correct_answer))
+    if item is not None:
+        yield dump(item)
+
+EXPORTERS = {"quiz": export_quizzes, "mock_test": export_mock_tests}
+
+async def export_items(db, owner_id, kinds):
+    """NDJSON lines for ``owner_id``'s items of each of ``kinds``; closes ``db`` when done.
+
+    The response streams after the request's dependencies have exited, so the
+    session is closed here rather than by get_db.
+    """
+    try:
+        for kind in kinds:
+            async for line in EXPORTERS[kind](db, owner_id):
+                yield line
+    finally:
+        await db.close()
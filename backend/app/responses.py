@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional
+
+import brotli
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from .cache import Cache
+
+# Bodies below this size are served uncompressed; the headers would eat the gain
+MIN_COMPRESS_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # Quality 11 is several times slower for a few percent smaller bodies
+CODINGS = ("br", "gzip")
+
+@dataclass(frozen=True)
+class Validators:
+    """What conditional requests are checked against.
+
+    ``tag`` changes whenever the content does; each encoding of the body gets
+    its own strong ETag derived from it. ``last_modified`` is a Unix time.
+    """
+
+    tag: str
+    last_modified: Optional[float] = None
+
+    def etag(self, coding=None):
+        return f'"{self.tag}-{coding}"' if coding else f'"{self.tag}"'
+
+    def headers(self, coding=None):
+        headers = {"Vary": "Accept-Encoding", "ETag": self.etag(coding)}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = formatdate(self.last_modified, usegmt=True)
+        return headers
+
+    def matches(self, request_headers):
+        """True when the request's validators show the client copy is current."""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # Weak comparison, and any encoding of the same content matches
+            for etag in if_none_match.split(","):
+                etag = etag.strip().removeprefix("W/").strip('"')
+                if etag == "*" or etag == self.tag or etag in (f"{self.tag}-{coding}" for coding in CODINGS):
+                    return True
+            return False
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole-second precision
+        return int(self.last_modified) <= since
+
+    def not_modified(self, request_headers):
+        coding = choose_encoding(request_headers.get("accept-encoding"), CODINGS)
+        return Response(status_code=304, headers=self.headers(coding))
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """A content payload serialised once, with its compressed variants."""
+
+    owner_id: Optional[int]
+    body: bytes
+    encoded: dict # {"gzip": bytes, "br": bytes}, empty for small bodies
+    validators: Validators
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    def to_response(self, request_headers):
+        if self.validators.matches(request_headers):
+            return self.validators.not_modified(request_headers)
+        coding = choose_encoding(request_headers.get("accept-encoding"), self.encoded)
+        headers = self.validators.headers(coding)
+        if coding is None:
+            return Response(self.body, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = coding
+        return Response(self.encoded[coding], media_type="application/json", headers=headers)
+
+def choose_encoding(accept_encoding, available):
+    """Best of ``available`` accepted by an Accept-Encoding header (brotli preferred)."""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    candidates = [c for c in CODINGS if c in available and accepted.get(c, accepted.get("*", 0)) > 0]
+    return max(candidates, key=lambda c: accepted.get(c, accepted.get("*", 0)), default=None)
+
+@lru_cache(maxsize=None)
+def adapter(schema):
+    # Building an adapter compiles the schema's validator and serializer; the
+    # routes use a handful of schemas, so each is built once
+    return TypeAdapter(schema)
+
+def serialize(schema, value, validators, owner_id=None):
+    # pydantic's Rust serializer writes the JSON straight to bytes
+    schema_adapter = adapter(schema)
+    body = schema_adapter.dump_json(schema_adapter.validate_python(value, from_attributes=True))
+    encoded = {}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoded = {
+            "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+            "br": brotli.compress(body, quality=BROTLI_QUALITY),
+        }
+    return CachedResponse(owner_id=owner_id, body=body, encoded=encoded, validators=validators)
+
+# Serialised quiz and mock-test payloads, keyed by ("quiz", id), ("quizzes",
+# owner_id), ("mock_test", id) and ("mock_tests", owner_id) and bounded by
+# total bytes. The write endpoints drop the matching keys; the TTL bounds
+# staleness in other worker processes.
+content_cache = Cache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+    getsizeof=lambda entry: entry.size,
+)
+
+def item_validators(kind, item_id, version, updated_at):
+    return Validators(f"{kind}-{item_id}-v{version}", updated_at)
+
+def list_validators(kind, owner_id, count, max_id, version_sum, max_updated_at):
+    # Creating, updating or deleting any item changes at least one of these.
+    # Deletes do not move a Last-Modified time, so lists only get an ETag.
+    state = f"{count}-{max_id or 0}-{version_sum or 0}-{max_updated_at or 0!r}"
+    return Validators(f"{kind}-{owner_id}-{hashlib.sha256(state.encode()).hexdigest()[:16]}")
+
+def invalidate(*keys):
+    for key in keys:
+        content_cache.invalidate(key)
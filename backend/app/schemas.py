@@ -1,5 +1,12 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List, Dict, Any, Union
+import json
+
+def parse_json_field(value):
+    # Some columns are stored as JSON strings in the database
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
 
 class UserCreate(BaseModel):
     email: str
@@ -23,6 +30,22 @@ class User(BaseModel):
     class Config:
         orm_mode = True
 
+class UserPage(BaseModel):
+    items: List[User]
+    # Pass back as ?cursor= for the next page: the last email when filtered by
+    # email_prefix, otherwise the last id
+    next_cursor: Optional[Union[int, str]] = None
+
+class UserImportError(BaseModel):
+    line: int # 1-based line of the upload, counting a CSV header
+    email: Optional[str] = None
+    detail: str
+
+class UserImportReport(BaseModel):
+    created: int
+    failed: int
+    errors: List[UserImportError]
+
 class UserUpdate(BaseModel):
     email: Optional[str] = None
     password: Optional[str] = None
@@ -46,9 +69,6 @@ class Question(QuestionBase):
 
     @property
     def options_list(self) -> List[str]:
-        import json
-        if isinstance(self.options, str):
-            return json.loads(self.options)
         return self.options
 
 class QuizBase(BaseModel):
@@ -66,6 +86,30 @@ class Quiz(QuizBase):
     class Config:
         orm_mode = True
 
+class QuestionBankImportError(BaseModel):
+    line: int # 1-based line of the upload
+    detail: str
+
+class QuestionBankImportReport(BaseModel):
+    quizzes: int
+    mock_tests: int
+    failed: int
+    errors: List[QuestionBankImportError]
+
+class SearchHit(BaseModel):
+    item_type: str # quiz or mock_test
+    item_id: int
+    title: Optional[str] = None
+    source: str # question, passage, task1 or task2
+    source_id: int # Question id, or section id for passages and tasks
+    section: Optional[str] = None # For mock tests
+    snippet: str # Matched terms in [brackets]
+    score: float # Higher is better
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[int] = None # Pass back as ?cursor= for the next page
+
 # Mock Test Schemas
 class MockTestQuestionBase(BaseModel):
     text: str
@@ -122,6 +166,12 @@ class MockTestSubmission(BaseModel):
     test_id: int
     answers: Dict[str, Dict[str, str]] # section_name: {question_id: answer}
 
+class BatchGradeSubmission(MockTestSubmission):
+    user_id: Optional[int] = None # Echoed back so results can be matched to students
+
+class BatchGradeRequest(BaseModel):
+    submissions: List[BatchGradeSubmission]
+
 class TestResultBase(BaseModel):
     mock_test_id: int
     user_id: int
@@ -131,6 +181,8 @@ class TestResultBase(BaseModel):
     total_questions_listening: int
     total_questions_reading: int
 
+    _parse_writing_feedback = field_validator("writing_feedback", mode="before")(parse_json_field)
+
 class TestResultCreate(TestResultBase):
     pass
 
@@ -138,4 +190,50 @@ class TestResult(TestResultBase):
     id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class TestResultPage(BaseModel):
+    items: List[TestResult]
+    next_cursor: Optional[int] = None
+
+class SectionAnalytics(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    percentiles: Dict[str, int] # p25, p50, p75, p90
+    histogram: Dict[int, int] # score: number of results
+
+class QuestionAnalytics(BaseModel):
+    question_id: int
+    section: str
+    attempts: int
+    correct: int
+    percent_correct: Optional[float] = None
+
+class MockTestAnalytics(BaseModel):
+    mock_test_id: int
+    sections: Dict[str, SectionAnalytics]
+    questions: List[QuestionAnalytics]
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    score: int # listening + reading, the user's best result
+
+class Leaderboard(BaseModel):
+    mock_test_id: int
+    total: int # Ranked users
+    entries: List[LeaderboardEntry]
+    me: Optional[LeaderboardEntry] = None
+
+class WritingFeedbackJob(BaseModel):
+    id: int
+    mock_test_id: int
+    status: str
+    attempts: int
+    feedback: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    _parse_feedback = field_validator("feedback", mode="before")(parse_json_field)
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,230 @@
+"""Full-text search over a teacher's quizzes and mock tests.
+
+One search document is kept per quiz question, mock-test question, reading
+passage and writing task, in ``search_documents``:
+
+* on SQLite, an FTS5 table (porter-stemmed). The owner and the item are
+  stored as tokens (``u12``; ``quiz quiz7`` or ``mocktest mocktest3``), so
+  owner scoping and removing an item are index lookups, not scans.
+* on Postgres, a plain table with a generated ``tsvector`` column under a GIN
+  index, plus B-tree indexes for the owner and the item.
+
+The routes keep it in sync. Creating a quiz or mock test (directly or by a
+question-bank import) indexes it with one INSERT ... SELECT. Updating it
+replaces its documents. Deleting it, or its owner, removes them. It can be
+rebuilt from the content tables at any time:
+
+    python -m app.search
+"""
+import re
+
+from sqlalchemy import (
+    BigInteger, Column, Integer, MetaData, String, Table, Text, cast, delete, event, insert, literal, null, select,
+    text, true, union_all,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from . import models
+from .database import Base, engine
+
+ITEM_TYPES = ("quiz", "mock_test")
+ITEM_TOKENS = {"quiz": "quiz", "mock_test": "mocktest"}
+SNIPPET_START, SNIPPET_END = "[", "]" # Around the matched terms in snippets
+SNIPPET_WORDS = 16
+
+def document_columns():
+    return [
+        Column("body", Text),
+        Column("item_type", String), # quiz or mock_test
+        Column("item_id", Integer),
+        Column("title", String), # The quiz or mock test's, for display
+        Column("source", String), # question, passage, task1 or task2
+        Column("source_id", Integer), # Question id, or section id for passages and tasks
+        Column("section", String), # listening, reading or writing for mock tests
+    ]
+
+# The table as each backend stores it
+fts_documents = Table(
+    "search_documents", MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("owner", String),
+    Column("item", String),
+    *document_columns(),
+)
+pg_documents = Table(
+    "search_documents", MetaData(),
+    Column("id", BigInteger, primary_key=True),
+    Column("owner_id", Integer),
+    Column("body_tsv", TSVECTOR),
+    *document_columns(),
+)
+DOCUMENT_COLUMNS = [column.name for column in document_columns()]
+
+def create_index(conn):
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "id BIGSERIAL PRIMARY KEY, owner_id INTEGER, body TEXT, item_type VARCHAR, item_id INTEGER, "
+            "title VARCHAR, source VARCHAR, source_id INTEGER, section VARCHAR, "
+            "body_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', coalesce(body, ''))) STORED)"
+        )
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_search_documents_body_tsv ON search_documents USING GIN (body_tsv)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_search_documents_owner_id ON search_documents (owner_id)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_search_documents_item ON search_documents (item_type, item_id)")
+    else:
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5("
+            "body, owner, item, item_type UNINDEXED, item_id UNINDEXED, title UNINDEXED, "
+            "source UNINDEXED, source_id UNINDEXED, section UNINDEXED, tokenize = 'porter unicode61')"
+        )
+
+def drop_index(conn):
+    conn.exec_driver_sql("DROP TABLE IF EXISTS search_documents")
+
+# Created and dropped along with the model tables (migration 1, the tests)
+event.listen(Base.metadata, "after_create", lambda target, connection, **kw: create_index(connection))
+event.listen(Base.metadata, "after_drop", lambda target, connection, **kw: drop_index(connection))
+
+def tokens(item_type, owner_id, item_id):
+    # The owner and item tokens of the SQLite index, as SQL expressions
+    item_token = ITEM_TOKENS[item_type]
+    return (
+        (literal("u") + cast(owner_id, String)).label("owner"),
+        (literal(f"{item_token} {item_token}") + cast(item_id, String)).label("item"),
+    )
+
+def quiz_documents(*where):
+    quiz, question = models.Quiz, models.Question
+    return select(
+        question.text.label("body"), literal("quiz").label("item_type"), quiz.id.label("item_id"),
+        quiz.title.label("title"), literal("question").label("source"), question.id.label("source_id"),
+        null().label("section"), quiz.owner_id.label("owner_id"), *tokens("quiz", quiz.owner_id, quiz.id),
+    ).join_from(question, quiz, question.quiz_id == quiz.id).where(*where)
+
+def mock_test_documents(*where):
+    mock_test, section, section_question = models.MockTest, models.MockTestSection, models.MockTestQuestion
+
+    def section_documents(body, source, source_id):
+        return select(
+            body.label("body"), literal("mock_test").label("item_type"), mock_test.id.label("item_id"),
+            mock_test.title.label("title"), literal(source).label("source"), source_id.label("source_id"),
+            section.title.label("section"), mock_test.owner_id.label("owner_id"),
+            *tokens("mock_test", mock_test.owner_id, mock_test.id),
+        ).join_from(section, mock_test, section.mock_test_id == mock_test.id).where(*where)
+
+    questions = section_documents(section_question.text, "question", section_question.id).join(
+        section_question, section_question.section_id == section.id
+    )
+    texts = [
+        section_documents(getattr(section, field), field, section.id).where(getattr(section, field) != "")
+        for field in ("passage", "task1", "task2")
+    ]
+    return union_all(questions, *texts)
+
+DOCUMENTS = {"quiz": quiz_documents, "mock_test": mock_test_documents}
+
+def insert_documents(dialect, query):
+    docs = query.subquery()
+    extra = ["owner_id"] if dialect == "postgresql" else ["owner", "item"]
+    table = pg_documents if dialect == "postgresql" else fts_documents
+    columns = DOCUMENT_COLUMNS + extra
+    return insert(table).from_select(columns, select(*(docs.c[name] for name in columns)))
+
+def delete_documents(dialect, item_type=None, item_id=None, owner_id=None):
+    if dialect == "postgresql":
+        if owner_id is not None:
+            return delete(pg_documents).where(pg_documents.c.owner_id == owner_id)
+        return delete(pg_documents).where(pg_documents.c.item_type == item_type, pg_documents.c.item_id == item_id)
+    if owner_id is not None:
+        return delete(fts_documents).where(fts_documents.c.owner.match(f"u{owner_id}"))
+    return delete(fts_documents).where(fts_documents.c.item.match(f"{ITEM_TOKENS[item_type]}{item_id}"))
+
+def dialect_name(db):
+    return db.get_bind().dialect.name
+
+async def index(db, item_type, item_id):
+    """Add the documents of a new quiz or mock test."""
+    # Pending changes (e.g. a new title) must be visible to the INSERT ... SELECT
+    await db.flush()
+    model = models.Quiz if item_type == "quiz" else models.MockTest
+    await db.execute(insert_documents(dialect_name(db), DOCUMENTS[item_type](model.id == item_id)))
+
+async def remove(db, item_type, item_id):
+    await db.execute(delete_documents(dialect_name(db), item_type, item_id))
+
+async def reindex(db, item_type, item_id):
+    await remove(db, item_type, item_id)
+    await index(db, item_type, item_id)
+
+async def remove_owner(db, owner_id):
+    await db.execute(delete_documents(dialect_name(db), owner_id=owner_id))
+
+def fts_query(owner_id, query, item_type=None):
+    """An FTS5 MATCH expression for ``query``'s words within ``owner_id``'s documents, or None."""
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    # Quoted, so no word is read as FTS5 syntax (AND, NEAR, column filters)
+    terms = " ".join(f'"{word}"' for word in words)
+    match = f"owner : u{owner_id} AND body : ({terms})"
+    if item_type is not None:
+        match += f" AND item : {ITEM_TOKENS[item_type]}"
+    return match
+
+SQLITE_SEARCH = text(f"""
+    SELECT item_type, item_id, title, source, source_id, section,
+           snippet(search_documents, 0, '{SNIPPET_START}', '{SNIPPET_END}', '...', {SNIPPET_WORDS}) AS snippet,
+           -rank AS score
+    FROM search_documents
+    WHERE search_documents MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+POSTGRES_SEARCH = """
+    SELECT item_type, item_id, title, source, source_id, section,
+           ts_headline('english', body, query, 'StartSel={start}, StopSel={end}, MaxWords={words}, MinWords=5') AS snippet,
+           ts_rank(body_tsv, query) AS score
+    FROM search_documents, plainto_tsquery('english', :query) AS query
+    WHERE owner_id = :owner_id AND body_tsv @@ query {kind}
+    ORDER BY score DESC, id
+    LIMIT :limit OFFSET :offset
+"""
+
+async def search(db, owner_id, query, item_type=None, cursor=0, limit=20):
+    """A page of ``owner_id``'s documents matching every word of ``query``, best first.
+
+    ``cursor`` is the number of hits already seen, as returned in
+    ``next_cursor``.
+    """
+    page = {"limit": limit + 1, "offset": cursor}
+    if dialect_name(db) == "postgresql":
+        statement = text(POSTGRES_SEARCH.format(
+            start=SNIPPET_START, end=SNIPPET_END, words=SNIPPET_WORDS,
+            kind="AND item_type = :item_type" if item_type else "",
+        ))
+        params = {"query": query, "owner_id": owner_id, "item_type": item_type, **page}
+    else:
+        match = fts_query(owner_id, query, item_type)
+        if match is None:
+            return {"items": [], "next_cursor": None}
+        statement, params = SQLITE_SEARCH, {"match": match, **page}
+    rows = [dict(row._mapping) for row in await db.execute(statement, params)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = cursor + limit
+    return {"items": rows, "next_cursor": next_cursor}
+
+def rebuild(conn):
+    """Replace every search document with ones built from the content tables."""
+    dialect = conn.dialect.name
+    conn.execute(delete(pg_documents if dialect == "postgresql" else fts_documents))
+    for item_type in ITEM_TYPES:
+        conn.execute(insert_documents(dialect, DOCUMENTS[item_type](true())))
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        create_index(conn)
+        rebuild(conn)
+    print("Search index rebuilt")
@@ -0,0 +1,26 @@
+"""Helpers for streamed (CSV and NDJSON) request and response bodies."""
+import codecs
+
+from fastapi import HTTPException
+
+NDJSON_TYPE = "application/x-ndjson"
+NDJSON_TYPES = (NDJSON_TYPE, "application/ndjson", "application/jsonl")
+
+async def lines(stream):
+    """Text lines of a streamed UTF-8 request body, without their line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    try:
+        async for chunk in stream:
+            buffer += decoder.decode(chunk)
+            *complete, buffer = buffer.split("\n")
+            for line in complete:
+                yield line.rstrip("\r")
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Upload must be UTF-8 text")
+    if buffer:
+        yield buffer.rstrip("\r")
+
+def content_type(request):
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
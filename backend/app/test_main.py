@@ -1,30 +1,39 @@
 import pytest
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from app.main import app, get_db
-from app.database import Base
+from app import admission, auth, grading, responses, schemas, writing
+from app.leaderboard import Leaderboard, leaderboards
+from app.database import Base, make_async_engine, make_engine
 import os
+import re
 
 # Use a test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+writing.feedback_queue.session_factory = sessionmaker(autoflush=False, bind=engine)
 
 @pytest.fixture(autouse=True)
 def setup_database():
     # Create test database tables
     Base.metadata.create_all(bind=engine)
+    auth.principal_cache.clear()
+    grading.answer_key_cache.clear()
+    responses.content_cache.clear()
+    leaderboards.clear()
+    admission.configure(ip_rule=admission.Rule(rate=1000, burst=1000))
     yield
     # Drop test database tables after tests
     Base.metadata.drop_all(bind=engine)
@@ -105,3 +114,1083 @@ def test_register_existing_email():
     )
     assert response.status_code == 400
     assert "Email already registered" in response.json()["detail"]
+
+
+def create_user_with_role(email, role, password="Test1234"):
+    response = client.post(
+        "/users/",
+        json={"email": email, "password": password, "re_password": password}
+    )
+    assert response.status_code == 200
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE users SET role = ? WHERE email = ?", (role, email))
+    response = client.post("/token", data={"username": email, "password": password})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+MOCK_TEST_PAYLOAD = {
+    "title": "IELTS Mock 1",
+    "description": "Full mock test",
+    "listening_section": {
+        "title": "listening",
+        "questions": [
+            {"text": "L1", "options": ["a", "b"], "correct_answer": "a"},
+            {"text": "L2", "options": ["a", "b"], "correct_answer": "b"}
+        ]
+    },
+    "reading_section": {
+        "title": "reading",
+        "passage": "Once upon a time",
+        "questions": [
+            {"text": "R1", "options": ["c", "d"], "correct_answer": "d"}
+        ]
+    },
+    "writing_section": {"title": "writing", "task1": "Describe a chart", "task2": "Discuss"}
+}
+
+def test_quiz_crud():
+    headers = create_user_with_role("teacher1@gmail.com", "teacher")
+    response = client.post(
+        "/quizzes/",
+        json={"title": "Quiz 1", "questions": [{"text": "Q1", "options": ["a", "b"], "correct_answer": "a"}]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    quiz = response.json()
+    assert quiz["questions"][0]["options"] == ["a", "b"]
+
+    response = client.put(
+        f"/quizzes/{quiz['id']}",
+        json={"title": "Quiz 1b", "questions": [{"text": "Q2", "options": ["c"], "correct_answer": "c"}]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert [q["text"] for q in response.json()["questions"]] == ["Q2"]
+
+    response = client.get("/quizzes/", headers=headers)
+    assert response.status_code == 200
+    assert [q["title"] for q in response.json()] == ["Quiz 1b"]
+
+    assert client.delete(f"/quizzes/{quiz['id']}", headers=headers).status_code == 200
+    assert client.get(f"/quizzes/{quiz['id']}", headers=headers).status_code == 404
+
+def test_mock_test_submit_and_results():
+    teacher = create_user_with_role("teacher2@gmail.com", "teacher")
+    response = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher)
+    assert response.status_code == 200
+    mock_test = response.json()
+    listening = mock_test["listening_section"]["questions"]
+    reading = mock_test["reading_section"]["questions"]
+
+    student = create_user_with_role("student1@gmail.com", "student")
+    response = client.post(
+        f"/mock-tests/{mock_test['id']}/submit",
+        json={
+            "test_id": mock_test["id"],
+            "answers": {
+                "listening": {str(listening[0]["id"]): "a", str(listening[1]["id"]): "a"},
+                "reading": {str(reading[0]["id"]): "d"}
+            }
+        },
+        headers=student
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["listening_score"], data["reading_score"]) == (1, 1)
+    assert (data["total_questions_listening"], data["total_questions_reading"]) == (2, 1)
+
+    response = client.post(
+        "/test-results/",
+        json={
+            "mock_test_id": mock_test["id"],
+            "user_id": 0,
+            "listening_score": 1,
+            "reading_score": 1,
+            "writing_feedback": {"task1_feedback": "ok"},
+            "total_questions_listening": 2,
+            "total_questions_reading": 1
+        },
+        headers=student
+    )
+    assert response.status_code == 200
+    response = client.get("/test-results/me/", headers=student)
+    assert response.status_code == 200
+    assert response.json()["items"][0]["writing_feedback"] == {"task1_feedback": "ok"}
+
+def test_question_bank_round_trip(monkeypatch):
+    import json
+    from app import question_bank
+
+    monkeypatch.setattr(question_bank, "IMPORT_CHUNK_SIZE", 2)
+    source = create_user_with_role("teacher19@gmail.com", "teacher")
+    target = create_user_with_role("teacher20@gmail.com", "teacher")
+    client.post("/quizzes/", json={"title": "Empty quiz", "questions": []}, headers=source)
+    client.post("/quizzes/", json={"title": "Quiz", "questions": [{"text": "Q1", "options": ["a", "b"], "correct_answer": "b"}]}, headers=source)
+    for _ in range(2):
+        client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=source)
+
+    response = client.get("/question-bank/export", headers=source)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["type"] for item in items] == ["quiz", "quiz", "mock_test", "mock_test"]
+    assert items[1]["questions"] == [{"text": "Q1", "options": ["a", "b"], "correct_answer": "b"}]
+    assert items[2]["reading_section"]["passage"] == "Once upon a time"
+    assert [q["text"] for q in items[2]["listening_section"]["questions"]] == ["L1", "L2"]
+    assert len(client.get("/question-bank/export?kind=quiz", headers=source).text.splitlines()) == 2
+
+    upload = response.text + '\nnot json\n{"type": "poll"}\n{"type": "quiz", "questions": []}\n'
+    response = client.post("/question-bank/import", content=upload, headers={**target, "Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["quizzes"], report["mock_tests"], report["failed"]) == (2, 2, 3)
+    assert [(e["line"], e["detail"]) for e in report["errors"]] == [
+        (6, "Invalid JSON"), (7, "type must be quiz or mock_test"), (8, "title: Field required"),
+    ]
+    copied = client.get("/mock-tests/", headers=target).json()
+    assert len(copied) == 2 and copied[0]["title"] == "IELTS Mock 1"
+    assert [q["correct_answer"] for q in copied[0]["listening_section"]["questions"]] == ["a", "b"]
+    assert client.get("/question-bank/export", headers=target).text == client.get("/question-bank/export", headers=source).text
+
+    assert client.post("/question-bank/import", content=upload, headers={**target, "Content-Type": "text/csv"}).status_code == 415
+
+def test_full_text_search():
+    teacher = create_user_with_role("teacher21@gmail.com", "teacher")
+    other = create_user_with_role("teacher22@gmail.com", "teacher")
+    admin = create_user_with_role("admin7@gmail.com", "admin")
+    search = lambda q, headers=teacher, **params: client.get("/search", params={"q": q, **params}, headers=headers).json()
+    payload = dict(MOCK_TEST_PAYLOAD, reading_section=dict(MOCK_TEST_PAYLOAD["reading_section"], passage="Glaciers are retreating across the Alps"))
+    test_id = client.post("/mock-tests/", json=payload, headers=teacher).json()["id"]
+    quiz = {"title": "Climate", "questions": [{"text": "Why do glaciers retreat?", "options": ["a"], "correct_answer": "a"}]}
+    quiz_id = client.post("/quizzes/", json=quiz, headers=teacher).json()["id"]
+    client.post("/mock-tests/", json=payload, headers=other)
+
+    hits = search("glacier")["items"]
+    assert {(h["item_type"], h["item_id"], h["source"]) for h in hits} == {("mock_test", test_id, "passage"), ("quiz", quiz_id, "question")}
+    passage = next(h for h in hits if h["source"] == "passage")
+    assert passage["title"] == "IELTS Mock 1" and passage["section"] == "reading"
+    assert "[Glaciers]" in passage["snippet"]
+    assert [h["item_id"] for h in search("glaciers alps")["items"]] == [test_id]
+    assert [h["item_type"] for h in search("glacier", kind="quiz")["items"]] == ["quiz"]
+    assert search("describe chart")["items"][0]["source"] == "task1"
+    assert search('" OR owner : u1 NEAR(')["items"] == []
+
+    first = search("glacier", limit=1)
+    assert len(first["items"]) == 1 and first["next_cursor"] == 1
+    second = search("glacier", limit=1, cursor=1)
+    assert second["next_cursor"] is None
+    assert [h["source_id"] for h in first["items"] + second["items"]] == [h["source_id"] for h in hits]
+
+    # Kept in sync with updates and deletes
+    quiz["questions"][0]["text"] = "Why do deserts spread?"
+    client.put(f"/quizzes/{quiz_id}", json=quiz, headers=teacher)
+    assert [h["item_type"] for h in search("glacier")["items"]] == ["mock_test"]
+    assert [h["item_id"] for h in search("deserts")["items"]] == [quiz_id]
+    client.put(f"/mock-tests/{test_id}", json=dict(payload, title="Renamed"), headers=teacher)
+    assert search("glacier")["items"][0]["title"] == "Renamed"
+    client.delete(f"/mock-tests/{test_id}", headers=teacher)
+    assert search("glacier")["items"] == []
+    assert len(search("glacier", headers=other)["items"]) == 1
+
+    other_id = client.get("/users/me/", headers=other).json()["id"]
+    client.delete(f"/admin/users/{other_id}", headers=admin)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM search_documents WHERE owner MATCH ?", (f"u{other_id}",)).scalar() == 0
+
+    assert client.get("/search", params={"q": "glacier"}, headers=create_user_with_role("student10@gmail.com", "student")).status_code == 403
+
+def test_mock_test_update_and_delete():
+    headers = create_user_with_role("teacher3@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=headers).json()["id"]
+
+    payload = dict(MOCK_TEST_PAYLOAD, title="IELTS Mock 2")
+    payload["reading_section"] = {"title": "reading", "passage": "New passage", "questions": []}
+    response = client.put(f"/mock-tests/{test_id}", json=payload, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "IELTS Mock 2"
+    assert data["reading_section"]["passage"] == "New passage"
+    assert data["reading_section"]["questions"] == []
+    assert len(data["listening_section"]["questions"]) == 2
+
+    response = client.get("/mock-tests/", headers=headers)
+    assert [t["title"] for t in response.json()] == ["IELTS Mock 2"]
+    assert client.delete(f"/mock-tests/{test_id}", headers=headers).status_code == 200
+    assert client.get(f"/mock-tests/{test_id}", headers=headers).status_code == 404
+
+def test_admin_user_management():
+    admin = create_user_with_role("admin1@gmail.com", "admin")
+    student = create_user_with_role("student2@gmail.com", "student")
+    users = client.get("/admin/users/", headers=admin).json()["items"]
+    student_id = next(u["id"] for u in users if u["email"] == "student2@gmail.com")
+
+    response = client.put(f"/admin/users/{student_id}", json={"role": "teacher"}, headers=admin)
+    assert response.status_code == 200
+    assert response.json()["role"] == "teacher"
+
+    assert client.get("/admin/users/", headers=student).status_code == 403
+    assert client.delete(f"/admin/users/{student_id}", headers=admin).status_code == 200
+    assert client.get(f"/admin/users/{student_id}", headers=admin).status_code == 404
+
+def test_bulk_user_import(monkeypatch):
+    from app import user_import
+
+    monkeypatch.setattr(user_import, "BATCH_SIZE", 2)
+    admin = create_user_with_role("admin6@gmail.com", "admin")
+    create_user_with_role("taken@gmail.com", "student")
+    upload = "\n".join([
+        "email,password",
+        "pupil1@gmail.com,Pupil1234",
+        "pupil2@gmail.com,short",
+        "",
+        "taken@gmail.com,Taken1234",
+        "pupil1@gmail.com,Pupil1234",
+        "pupil3@yahoo.com,Pupil1234",
+        "pupil4@gmail.com,Pupil1234,extra",
+        "pupil5@gmail.com,Pupil1234",
+    ])
+    response = client.post("/admin/users/import", content=upload, headers={**admin, "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 2 and report["failed"] == 5
+    assert [(e["line"], e["detail"]) for e in report["errors"]] == [
+        (3, "Password must be at least 8 characters"),
+        (5, "Email already registered"),
+        (6, "Email appears more than once in the upload"),
+        (7, "Only Gmail addresses are allowed"),
+        (8, "Expected 2 columns, got 3"),
+    ]
+    for email in ("pupil1@gmail.com", "pupil5@gmail.com"):
+        assert client.post("/token", data={"username": email, "password": "Pupil1234"}).status_code == 200
+
+    upload = '{"email": "pupil6@gmail.com", "password": "Pupil1234"}\nnot json\n{"email": "pupil7@gmail.com", "password": 1234}\n'
+    report = client.post("/admin/users/import", content=upload, headers={**admin, "Content-Type": "application/x-ndjson"}).json()
+    assert report["created"] == 1
+    assert [(e["line"], e["detail"]) for e in report["errors"]] == [(2, "Invalid JSON"), (3, "email and password must be strings")]
+
+    assert client.post("/admin/users/import", content="email\nx@gmail.com", headers={**admin, "Content-Type": "text/csv"}).status_code == 400
+    assert client.post("/admin/users/import", content="[]", headers={**admin, "Content-Type": "application/json"}).status_code == 415
+    student = create_user_with_role("student9@gmail.com", "student")
+    assert client.post("/admin/users/import", content=upload, headers={**student, "Content-Type": "application/x-ndjson"}).status_code == 403
+
+def test_password_hashing_runs_on_pool():
+    admin = create_user_with_role("admin2@gmail.com", "admin")
+    stats = client.get("/admin/stats/", headers=admin).json()["password_hashing"]
+    # one hash on registration, one verify on login
+    assert stats["completed"] >= 2
+    assert stats["in_flight"] == 0
+
+def test_password_pool_process_workers():
+    from app.pools import WorkerPool
+    import asyncio
+
+    pool = WorkerPool(max_workers=2, kind="process")
+    # Workers come from a forkserver, not a fork of this threaded process
+    assert pool.executor._mp_context.get_start_method() in ("forkserver", "spawn")
+    try:
+        hashed = asyncio.run(pool.run(auth.get_password_hash, "Test1234"))
+        assert asyncio.run(pool.run(auth.verify_password, "Test1234", hashed))
+    finally:
+        pool.shutdown()
+    assert pool.stats()["completed"] == 2
+
+def test_principal_cache_invalidated_on_role_change():
+    admin = create_user_with_role("admin3@gmail.com", "admin")
+    teacher = create_user_with_role("teacher4@gmail.com", "teacher")
+    assert client.get("/quizzes/", headers=teacher).status_code == 200
+    hits = auth.principal_cache.hits
+    assert client.get("/quizzes/", headers=teacher).status_code == 200
+    assert auth.principal_cache.hits == hits + 1
+
+    teacher_id = client.get("/users/me/", headers=teacher).json()["id"]
+    response = client.put(f"/admin/users/{teacher_id}", json={"role": "student"}, headers=admin)
+    assert response.status_code == 200
+    assert client.get("/quizzes/", headers=teacher).status_code == 403
+
+    assert client.delete(f"/admin/users/{teacher_id}", headers=admin).status_code == 200
+    assert client.get("/users/me/", headers=teacher).status_code == 401
+
+def test_admission_control_rejects_with_retry_after(monkeypatch):
+    create_user_with_role("victim@gmail.com", "student")
+    admission.configure(ip_rule=admission.Rule(rate=1000, burst=1000), account_rule=admission.Rule(rate=0.01, burst=2))
+    login = {"username": "victim@gmail.com", "password": "wrongpass1"}
+    assert [client.post("/token", data=login).status_code for _ in range(2)] == [401, 401]
+    response = client.post("/token", data=login)
+    assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+    # Other accounts from the same address are unaffected
+    assert client.post("/token", data={**login, "username": "other@gmail.com"}).status_code == 401
+
+    admission.configure(ip_rule=admission.Rule(rate=0.01, burst=1))
+    registration = {"email": "flood@gmail.com", "password": "password1", "re_password": "password1"}
+    assert client.post("/users/", json=registration).status_code == 200
+    assert client.post("/users/", json={**registration, "email": "flood2@gmail.com"}).status_code == 429
+
+    # A full password pool turns new hashing work away instead of queueing it
+    admission.configure(ip_rule=admission.Rule(rate=1000, burst=1000), max_pending_hashes=2)
+    monkeypatch.setattr(auth.password_pool, "in_flight", 2)
+    assert client.post("/users/", json={**registration, "email": "flood3@gmail.com"}).status_code == 429
+    assert admission.controller.stats()["rejected"] == {"ip": 0, "account": 0, "hash_capacity": 1}
+
+def test_logins_from_one_address_are_not_throttled_per_ip():
+    import asyncio
+
+    # A classroom behind one NAT address logs in at once; each account only
+    # spends from its own bucket, and sign-ups keep the tight per-IP limit
+    controller = admission.configure()
+    async def admit_class():
+        for i in range(64):
+            await controller.admit("203.0.113.7", account=f"student{i}@gmail.com")
+    asyncio.run(admit_class())
+    assert controller.stats()["admitted"] == 64
+    assert controller.ip_rule.burst < 64 <= controller.login_ip_rule.burst
+
+def test_token_buckets_refill():
+    import asyncio
+
+    # Shared stores must implement the whole interface
+    with pytest.raises(TypeError):
+        type("PartialStore", (admission.RateLimitStore,), {"take": admission.MemoryRateLimitStore.take})()
+    now = [0.0]
+    store = admission.MemoryRateLimitStore(clock=lambda: now[0])
+    rule = admission.Rule(rate=0.5, burst=2)
+    take = lambda: asyncio.run(store.take("key", rule))
+    assert [take(), take()] == [0.0, 0.0]
+    assert take() == 2.0
+    now[0] = 2.0
+    assert take() == 0.0 and take() == 2.0
+
+def test_metrics_use_route_templates():
+    from app import metrics
+
+    sample = lambda name, **labels: metrics.registry.get_sample_value(name, labels) or 0
+    route = {"method": "GET", "route": "/mock-tests/{test_id}"}
+    before = {
+        "requests": sample("http_request_duration_seconds_count", **route),
+        "not_found": sample("http_requests_total", **route, status="404"),
+        "queries": sample("http_request_db_queries_sum", **route),
+        "hashing": sample("http_request_password_hash_duration_seconds_count", method="POST", route="/token"),
+        "unmatched": sample("http_requests_total", method="GET", route=metrics.UNMATCHED_ROUTE, status="404"),
+    }
+    teacher = create_user_with_role("teacher17@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    client.get(f"/mock-tests/{test_id}", headers=teacher)
+    client.get("/mock-tests/999", headers=teacher)
+    client.get("/no-such-page")
+
+    assert sample("http_request_duration_seconds_count", **route) == before["requests"] + 2
+    assert sample("http_requests_total", **route, status="404") == before["not_found"] + 1
+    assert sample("http_request_db_queries_sum", **route) > before["queries"]
+    assert sample("http_request_password_hash_duration_seconds_count", method="POST", route="/token") == before["hashing"] + 1
+    assert sample("http_requests_total", method="GET", route=metrics.UNMATCHED_ROUTE, status="404") == before["unmatched"] + 1
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/mock-tests/{test_id}"' in response.text
+    assert f'route="/mock-tests/{test_id}"' not in response.text
+
+def test_query_profiler(caplog):
+    from app import profiler
+
+    shape = profiler.statement_shape
+    assert shape("SELECT * FROM t WHERE id IN (?, ?, ?)") == shape("SELECT *  FROM t\nWHERE id IN ($1)")
+    assert shape("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == shape("INSERT INTO t (a, b) VALUES (?, ?)")
+
+    admin = create_user_with_role("admin5@gmail.com", "admin")
+    teacher = create_user_with_role("teacher18@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    assert "x-query-profile" not in client.get(f"/mock-tests/{test_id}", headers=teacher).headers
+
+    profiler.configure(enabled=True, slow_query_ms=0, n_plus_one_threshold=2)
+    try:
+        with caplog.at_level("WARNING", logger="app.sql"):
+            response = client.post("/token", data={"username": "teacher18@gmail.com", "password": "Test1234"})
+        profile_id = int(response.headers["x-query-profile"])
+        slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow query")]
+        assert slow and all("POST /token" in message for message in slow)
+        assert not any("teacher18" in r.getMessage() for r in caplog.records)
+
+        profile = client.get(f"/admin/query-profiles/{profile_id}", headers=admin).json()
+        assert profile["route"] == "/token" and profile["status"] == 200
+        assert profile["queries"] == len(profile["timeline"]) >= 1
+        assert profile["timeline"][0]["parameters"] == 1
+        assert profile_id in [p["id"] for p in client.get("/admin/query-profiles/", headers=admin).json()]
+        assert client.get("/admin/query-profiles/0", headers=admin).status_code == 404
+        assert client.get("/admin/query-profiles/", headers=teacher).status_code == 403
+
+        # The same shape run repeatedly within one request is reported as N+1
+        scope = {"type": "http", "method": "GET", "path": "/loop"}
+        profile, token = profiler.query_profiler.start(scope)
+        for _ in range(3):
+            profiler.query_profiler.record("SELECT name FROM users WHERE id = ?", (1,), False, 0.0, 0.0)
+        with caplog.at_level("WARNING", logger="app.sql"):
+            profiler.query_profiler.finish(profile, token, 200)
+        assert profile.repeated(2) == [{"statement": "SELECT name FROM users WHERE id = ?", "count": 3}]
+        assert any("Possible N+1 in GET" in r.getMessage() for r in caplog.records)
+    finally:
+        profiler.configure()
+
+@contextmanager
+def capture_queries(*engines):
+    """Collect the (statement, parameters) pairs sent to the test database."""
+    queries = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+    engines = engines or (async_engine.sync_engine,)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield queries
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", record)
+
+@contextmanager
+def assert_max_queries(budget):
+    with capture_queries() as queries:
+        yield queries
+    statements = [statement for statement, _ in queries]
+    assert len(statements) <= budget, f"{len(statements)} queries over budget of {budget}:\n" + "\n".join(statements)
+
+def test_content_routes_stay_within_query_budget():
+    teacher = create_user_with_role("teacher5@gmail.com", "teacher")
+    questions = [{"text": f"Q{i}", "options": ["a", "b"], "correct_answer": "a"} for i in range(3)]
+    for i in range(5):
+        client.post("/quizzes/", json={"title": f"Quiz {i}", "questions": questions}, headers=teacher)
+    test_ids = [client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"] for _ in range(3)]
+    client.get("/users/me/", headers=teacher)  # warm the principal cache
+
+    with assert_max_queries(2):
+        assert len(client.get("/quizzes/", headers=teacher).json()) == 5
+    with assert_max_queries(2):
+        assert client.get("/quizzes/1", headers=teacher).status_code == 200
+    with assert_max_queries(3):
+        assert len(client.get("/mock-tests/", headers=teacher).json()) == 3
+    with assert_max_queries(3):
+        assert client.get(f"/mock-tests/{test_ids[0]}", headers=teacher).status_code == 200
+    submission = {"test_id": test_ids[0], "answers": {"listening": {}, "reading": {}}}
+    with assert_max_queries(2):
+        assert client.post(f"/mock-tests/{test_ids[0]}/submit", json=submission, headers=teacher).status_code == 200
+    # The compiled answer key is cached, so grading needs no DB reads; the only
+    # statement left is the per-question statistics upsert
+    with assert_max_queries(1):
+        assert client.post(f"/mock-tests/{test_ids[0]}/submit", json=submission, headers=teacher).status_code == 200
+
+def test_content_responses_are_cached_and_compressed():
+    teacher = create_user_with_role("teacher11@gmail.com", "teacher")
+    other = create_user_with_role("teacher12@gmail.com", "teacher")
+    payload = {**MOCK_TEST_PAYLOAD, "reading_section": {**MOCK_TEST_PAYLOAD["reading_section"], "passage": "Long passage. " * 200}}
+    test_id = client.post("/mock-tests/", json=payload, headers=teacher).json()["id"]
+    expected = client.get(f"/mock-tests/{test_id}", headers=teacher).json()
+
+    for accept_encoding, content_encoding in (("gzip, br", "br"), ("gzip", "gzip"), ("identity", None)):
+        with assert_max_queries(0):
+            response = client.get(f"/mock-tests/{test_id}", headers={**teacher, "Accept-Encoding": accept_encoding})
+        assert response.headers.get("content-encoding") == content_encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.json() == expected
+
+    # Cached entries stay scoped to their owner
+    assert client.get(f"/mock-tests/{test_id}", headers=other).status_code == 404
+
+    assert len(client.get("/mock-tests/", headers=teacher).json()) == 1
+    client.put(f"/mock-tests/{test_id}", json={**payload, "title": "Renamed"}, headers=teacher)
+    assert client.get(f"/mock-tests/{test_id}", headers=teacher).json()["title"] == "Renamed"
+    assert client.get("/mock-tests/", headers=teacher).json()[0]["title"] == "Renamed"
+    client.delete(f"/mock-tests/{test_id}", headers=teacher)
+    assert client.get(f"/mock-tests/{test_id}", headers=teacher).status_code == 404
+    assert client.get("/mock-tests/", headers=teacher).json() == []
+
+def test_content_cache_skips_loads_overtaken_by_a_write(monkeypatch):
+    from app import main
+
+    teacher = create_user_with_role("teacher33@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    load = main.get_mock_test
+
+    async def load_then_update(db, test_id, owner_id=None):
+        # The old row is loaded, then an update commits and invalidates before
+        # the load is cached, as update_mock_test would
+        mock_test = await load(db, test_id, owner_id)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE mock_tests SET title = 'Renamed', version = version + 1 WHERE id = ?", (test_id,))
+        responses.invalidate(("mock_test", test_id))
+        return mock_test
+
+    monkeypatch.setattr(main, "get_mock_test", load_then_update)
+    # The overlapping read may see the old row, but must not cache it
+    assert client.get(f"/mock-tests/{test_id}", headers=teacher).json()["title"] == MOCK_TEST_PAYLOAD["title"]
+    monkeypatch.setattr(main, "get_mock_test", load)
+    assert client.get(f"/mock-tests/{test_id}", headers=teacher).json()["title"] == "Renamed"
+
+    from app.cache import Cache
+
+    # Invalidating other keys does not stop a value being cached
+    cache = Cache(maxsize=10)
+    generation = cache.generation()
+    cache.invalidate("other key")
+    cache.set("key", "value", generation)
+    assert cache.get("key") == "value"
+
+def test_conditional_gets_of_content():
+    teacher = create_user_with_role("teacher13@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    response = client.get(f"/mock-tests/{test_id}", headers=teacher)
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    # A cold cache answers from the version columns without loading the graph
+    responses.content_cache.clear()
+    with assert_max_queries(1):
+        response = client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag
+    assert client.get(f"/mock-tests/{test_id}", headers=teacher).status_code == 200
+    with assert_max_queries(0):
+        assert client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-None-Match": etag}).status_code == 304
+    assert client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-None-Match": '"other"'}).status_code == 200
+
+    client.put(f"/mock-tests/{test_id}", json=MOCK_TEST_PAYLOAD, headers=teacher)
+    response = client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+    list_etag = client.get("/mock-tests/", headers=teacher).headers["etag"]
+    responses.content_cache.clear()
+    assert client.get("/mock-tests/", headers={**teacher, "If-None-Match": list_etag}).status_code == 304
+    client.delete(f"/mock-tests/{test_id}", headers=teacher)
+    assert client.get("/mock-tests/", headers={**teacher, "If-None-Match": list_etag}).status_code == 200
+    assert client.get(f"/mock-tests/{test_id}", headers={**teacher, "If-None-Match": etag}).status_code == 404
+
+def save_result(mock_test_id, listening_score, reading_score, headers):
+    result = {
+        "mock_test_id": mock_test_id,
+        "user_id": 0,
+        "listening_score": listening_score,
+        "reading_score": reading_score,
+        "writing_feedback": None,
+        "total_questions_listening": 2,
+        "total_questions_reading": 1,
+    }
+    assert client.post("/test-results/", json=result, headers=headers).status_code == 200
+
+def test_mock_test_analytics():
+    from app import analytics
+
+    teacher = create_user_with_role("teacher14@gmail.com", "teacher")
+    mock_test = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()
+    test_id = mock_test["id"]
+    l1, l2 = (str(q["id"]) for q in mock_test["listening_section"]["questions"])
+    r1 = str(mock_test["reading_section"]["questions"][0]["id"])
+    for i, (listening, reading) in enumerate([({l1: "a", l2: "b"}, {r1: "d"}), ({l1: "a", l2: "a"}, {r1: "c"}), ({l1: "b"}, {r1: "d"}), ({}, {})]):
+        student = create_user_with_role(f"analytics{i}@gmail.com", "student")
+        graded = client.post(f"/mock-tests/{test_id}/submit", json={"test_id": test_id, "answers": {"listening": listening, "reading": reading}}, headers=student).json()
+        save_result(test_id, graded["listening_score"], graded["reading_score"], student)
+
+    stats = client.get(f"/mock-tests/{test_id}/analytics", headers=teacher).json()
+    listening = stats["sections"]["listening"]
+    assert listening["count"] == 4 and listening["mean"] == 0.75
+    assert listening["histogram"] == {"0": 2, "1": 1, "2": 1}
+    assert listening["percentiles"] == {"p25": 0, "p50": 0, "p75": 1, "p90": 2}
+    assert stats["sections"]["reading"]["mean"] == 0.5
+    assert [(q["question_id"], q["attempts"], q["percent_correct"]) for q in stats["questions"]] == [
+        (int(l1), 4, 50.0), (int(l2), 4, 25.0), (int(r1), 4, 50.0),
+    ]
+
+    other = create_user_with_role("teacher15@gmail.com", "teacher")
+    assert client.get(f"/mock-tests/{test_id}/analytics", headers=other).status_code == 404
+
+    # The backfill rebuilds the same distributions from stored results
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM mock_test_score_buckets")
+        analytics.backfill(conn)
+    assert client.get(f"/mock-tests/{test_id}/analytics", headers=teacher).json()["sections"] == stats["sections"]
+
+    # Editing replaces the questions, and their statistics with them
+    old_key = grading.answer_key_cache.get(test_id)
+    edited = client.put(f"/mock-tests/{test_id}", json=MOCK_TEST_PAYLOAD, headers=teacher).json()
+    assert client.get(f"/mock-tests/{test_id}/analytics", headers=teacher).json()["questions"] == []
+
+    # A worker still grading with the old key records nothing for the old questions
+    grading.answer_key_cache.set(test_id, old_key)
+    response = client.post(f"/mock-tests/{test_id}/submit", json={"test_id": test_id, "answers": {"listening": {l1: "a"}, "reading": {r1: "d"}}}, headers=teacher)
+    assert response.status_code == 200
+    assert client.get(f"/mock-tests/{test_id}/analytics", headers=teacher).json()["questions"] == []
+    grading.invalidate_answer_key(test_id)
+    new_l1 = str(edited["listening_section"]["questions"][0]["id"])
+    client.post(f"/mock-tests/{test_id}/submit", json={"test_id": test_id, "answers": {"listening": {new_l1: "a"}}}, headers=teacher)
+    questions = client.get(f"/mock-tests/{test_id}/analytics", headers=teacher).json()["questions"]
+    assert [(q["question_id"], q["attempts"], q["correct"]) for q in questions][0] == (int(new_l1), 1, 1)
+
+def test_leaderboard_ranks():
+    board = Leaderboard(1)
+    for result_id, user_id, score in [(1, 10, 5), (2, 11, 7), (3, 12, 5), (4, 10, 3), (5, 13, 9), (6, 12, 8)]:
+        board.add(result_id, user_id, score)
+    # Each user keeps their best score; a worse later result changes nothing
+    assert [(e["rank"], e["user_id"], e["score"]) for e in board.top(10)] == [(1, 13, 9), (2, 12, 8), (3, 11, 7), (4, 10, 5)]
+    board.add(7, 10, 7)
+    assert board.top(10)[2:] == [{"rank": 3, "user_id": 11, "score": 7}, {"rank": 3, "user_id": 10, "score": 7}]
+    assert board.rank(10) == {"rank": 3, "user_id": 10, "score": 7}
+    assert board.rank(99) is None and len(board) == 4
+
+def test_leaderboard_endpoint(monkeypatch):
+    teacher = create_user_with_role("teacher16@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    alice = create_user_with_role("alice@gmail.com", "student")
+    bob = create_user_with_role("bob@gmail.com", "student")
+    save_result(test_id, 1, 0, alice)
+    save_result(test_id, 2, 1, bob)
+
+    board = client.get(f"/mock-tests/{test_id}/leaderboard", headers=alice).json()
+    assert [e["score"] for e in board["entries"]] == [3, 1] and board["total"] == 2
+    assert board["me"]["rank"] == 2
+
+    # Results stored by this process are applied straight away
+    save_result(test_id, 2, 1, alice)
+    with assert_max_queries(0):
+        board = client.get(f"/mock-tests/{test_id}/leaderboard", params={"limit": 1}, headers=alice).json()
+    assert board["me"]["rank"] == 1 and len(board["entries"]) == 1
+
+    # Results stored by another worker are picked up on the next refresh
+    monkeypatch.setattr(leaderboards, "refresh_interval", 0)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO test_results (mock_test_id, user_id, listening_score, reading_score) VALUES (?, 999, 2, 1)", (test_id,)
+        )
+    assert client.get(f"/mock-tests/{test_id}/leaderboard", headers=alice).json()["total"] == 3
+
+    assert client.get("/mock-tests/999/leaderboard", headers=alice).status_code == 404
+
+def test_test_results_must_be_possible_scores():
+    teacher = create_user_with_role("teacher32@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    mallory = create_user_with_role("mallory@gmail.com", "student")
+    result = {
+        "mock_test_id": test_id, "user_id": 0, "listening_score": 2, "reading_score": 1,
+        "writing_feedback": None, "total_questions_listening": 2, "total_questions_reading": 1,
+    }
+    assert client.post("/test-results/", json={**result, "mock_test_id": test_id + 1}, headers=mallory).status_code == 404
+    for invalid in ({"listening_score": 3}, {"reading_score": -1}, {"listening_score": 50, "total_questions_listening": 50}):
+        response = client.post("/test-results/", json={**result, **invalid}, headers=mallory)
+        assert response.status_code == 422, invalid
+    # None of them reached the leaderboard or the stored results
+    assert client.get(f"/mock-tests/{test_id}/leaderboard", headers=mallory).json()["total"] == 0
+    assert client.get("/test-results/me/", headers=mallory).json()["items"] == []
+    assert client.post("/test-results/", json=result, headers=mallory).status_code == 200
+    assert client.get(f"/mock-tests/{test_id}/leaderboard", headers=mallory).json()["me"]["score"] == 3
+
+def test_options_are_stored_as_json():
+    teacher = create_user_with_role("teacher10@gmail.com", "teacher")
+    quiz = {"title": "Quiz", "questions": [{"text": "Q", "options": ["a", "b"], "correct_answer": "a"}]}
+    quiz_id = client.post("/quizzes/", json=quiz, headers=teacher).json()["id"]
+    with engine.begin() as conn:
+        assert conn.exec_driver_sql("SELECT options FROM questions").scalar() == '["a", "b"]'
+        # Rows written by the old String column hold the same text
+        conn.exec_driver_sql("INSERT INTO questions (text, options, correct_answer, quiz_id) VALUES ('Old', '[\"c\", \"d\"]', 'c', ?)", (quiz_id,))
+    questions = client.get(f"/quizzes/{quiz_id}", headers=teacher).json()["questions"]
+    assert [q["options"] for q in questions] == [["a", "b"], ["c", "d"]]
+
+def unindexed_steps(statement, parameters):
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    # Index lookups read "SEARCH t USING ..."; every "SCAN" reads the whole table
+    # or index, and a temp B-tree sorts every matching row before the first is
+    # returned. FTS5 tables are virtual: "VIRTUAL TABLE INDEX 0:M2" is a
+    # full-text (MATCH) lookup.
+    return [
+        row[-1] for row in plan
+        if (row[-1].startswith("SCAN") and not re.search(r"VIRTUAL TABLE INDEX \d+:\S*M", row[-1]))
+        or row[-1] == "USE TEMP B-TREE FOR ORDER BY"
+    ]
+
+def test_hot_queries_use_indexes():
+    teacher = create_user_with_role("teacher9@gmail.com", "teacher")
+    student = create_user_with_role("student9@gmail.com", "student")
+    admin = create_user_with_role("admin9@gmail.com", "admin")
+    quiz = {"title": "Quiz", "questions": [{"text": "Q", "options": ["a", "b"], "correct_answer": "a"}]}
+    submission = {"answers": {"listening": {}, "reading": {}, "writing": {"task1": "Essay", "task2": "Essay"}}}
+
+    with capture_queries(async_engine.sync_engine, engine) as queries:
+        quiz_id = client.post("/quizzes/", json=quiz, headers=teacher).json()["id"]
+        client.get("/quizzes/", headers=teacher)
+        client.get(f"/quizzes/{quiz_id}", headers=teacher)
+        client.put(f"/quizzes/{quiz_id}", json=quiz, headers=teacher)
+        test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+        client.get("/mock-tests/", headers=teacher)
+        client.get(f"/mock-tests/{test_id}", headers=teacher)
+        client.put(f"/mock-tests/{test_id}", json=MOCK_TEST_PAYLOAD, headers=teacher)
+        result = client.post(f"/mock-tests/{test_id}/submit", json={"test_id": test_id, **submission}, headers=student).json()
+        wait_for_writing_feedback(result["writing_feedback_job_id"], student)
+        client.post(f"/mock-tests/{test_id}/grade-batch", json={"submissions": []}, headers=teacher)
+        save_result(test_id, 1, 1, student)
+        client.get(f"/mock-tests/{test_id}/analytics", headers=teacher)
+        client.get(f"/mock-tests/{test_id}/leaderboard", headers=student)
+        client.get("/test-results/me/", headers=student)
+        client.get("/test-results/me/", params={"mock_test_id": test_id, "cursor": 0}, headers=student)
+        client.get("/admin/users/", params={"role": "teacher", "cursor": 0}, headers=admin)
+        client.get("/admin/users/", params={"email_prefix": "student"}, headers=admin)
+        client.get("/search", params={"q": "upon a time", "kind": "mock_test"}, headers=teacher)
+        client.delete(f"/quizzes/{quiz_id}", headers=teacher)
+
+    scans = {}
+    for statement, parameters in queries:
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            found = unindexed_steps(statement, parameters)
+            if found:
+                scans[statement] = found
+    assert not scans, "unindexed plan steps:\n" + "\n".join(f"{plan}: {statement}" for statement, plan in scans.items())
+    # Walking a whole index is a scan too
+    assert unindexed_steps("SELECT count(*) FROM writing_feedback_cache", ()) == [
+        "SCAN writing_feedback_cache USING COVERING INDEX ix_writing_feedback_cache_last_used"
+    ]
+
+def test_keyset_pagination_and_filters():
+    admin = create_user_with_role("admin4@gmail.com", "admin")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO users (email, hashed_password, role, disabled) VALUES (?, 'x', ?, 0)",
+            # Inserted backwards, so id order is the reverse of email order
+            [(f"page{i:02d}@gmail.com", "teacher" if i % 2 else "student") for i in reversed(range(25))]
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO test_results (mock_test_id, user_id, listening_score, reading_score, total_questions_listening, total_questions_reading) "
+            "SELECT ?, id, 1, 1, 1, 1 FROM users WHERE email = 'admin4@gmail.com'",
+            [(1,), (2,), (1,)]
+        )
+
+    emails, cursor = [], None
+    while True:
+        params = {"limit": 10, "email_prefix": "page"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        page = client.get("/admin/users/", params=params, headers=admin).json()
+        emails += [u["email"] for u in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert emails == [f"page{i:02d}@gmail.com" for i in range(25)]
+    assert client.get("/admin/users/", params={"cursor": "page"}, headers=admin).status_code == 422
+
+    page = client.get("/admin/users/", params={"role": "teacher", "limit": 500}, headers=admin).json()
+    assert len(page["items"]) == 12 and page["next_cursor"] is None
+
+    page = client.get("/test-results/me/", params={"mock_test_id": 1, "limit": 1}, headers=admin).json()
+    assert len(page["items"]) == 1 and page["next_cursor"] is not None
+    page = client.get("/test-results/me/", params={"mock_test_id": 1, "cursor": page["next_cursor"]}, headers=admin).json()
+    assert len(page["items"]) == 1 and page["next_cursor"] is None
+
+def test_mock_test_creation_is_atomic(monkeypatch):
+    from app import main
+
+    teacher = create_user_with_role("teacher6@gmail.com", "teacher")
+    insert_questions = main.insert_questions
+    calls = []
+
+    async def failing_insert_questions(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("insert failed")
+        return await insert_questions(*args, **kwargs)
+
+    monkeypatch.setattr(main, "insert_questions", failing_insert_questions)
+    with pytest.raises(RuntimeError):
+        client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher)
+    with engine.connect() as conn:
+        for table in ("mock_tests", "mock_test_sections", "mock_test_questions"):
+            assert conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar() == 0
+
+def test_mock_test_creation_query_count_is_flat():
+    teacher = create_user_with_role("teacher7@gmail.com", "teacher")
+    client.get("/users/me/", headers=teacher)
+    payload = dict(MOCK_TEST_PAYLOAD)
+    payload["reading_section"] = dict(
+        MOCK_TEST_PAYLOAD["reading_section"],
+        questions=[{"text": f"R{i}", "options": ["a", "b"], "correct_answer": "a"} for i in range(40)]
+    )
+    # Including the one INSERT ... SELECT that adds it to the search index
+    with assert_max_queries(10):
+        response = client.post("/mock-tests/", json=payload, headers=teacher)
+    assert len(response.json()["reading_section"]["questions"]) == 40
+
+def test_answer_key_invalidated_on_update_and_delete():
+    teacher = create_user_with_role("teacher8@gmail.com", "teacher")
+    mock_test = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()
+    test_id = mock_test["id"]
+
+    def submit(answers):
+        response = client.post(f"/mock-tests/{test_id}/submit", json={"test_id": test_id, "answers": answers}, headers=teacher)
+        return response
+
+    reading_id = str(mock_test["reading_section"]["questions"][0]["id"])
+    assert submit({"reading": {reading_id: "d"}}).json()["reading_score"] == 1
+
+    payload = dict(MOCK_TEST_PAYLOAD)
+    payload["reading_section"] = dict(MOCK_TEST_PAYLOAD["reading_section"], questions=[{"text": "R1", "options": ["c", "d"], "correct_answer": "c"}])
+    updated = client.put(f"/mock-tests/{test_id}", json=payload, headers=teacher).json()
+    reading_id = str(updated["reading_section"]["questions"][0]["id"])
+    data = submit({"reading": {reading_id: "c"}}).json()
+    assert (data["reading_score"], data["total_questions_reading"]) == (1, 1)
+
+    assert client.delete(f"/mock-tests/{test_id}", headers=teacher).status_code == 200
+    assert submit({}).status_code == 404
+
+def test_principal_overtaken_by_a_role_change_is_not_cached(monkeypatch):
+    teacher = create_user_with_role("teacher35@gmail.com", "teacher")
+    validate = schemas.User.model_validate
+    demoted = []
+
+    def load_then_demote(obj, **kwargs):
+        # The teacher is loaded, then an admin's role change commits and
+        # invalidates before it is cached, as update_user would
+        user = validate(obj, **kwargs)
+        if not demoted:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("UPDATE users SET role = 'student' WHERE email = 'teacher35@gmail.com'")
+            auth.invalidate_principal("teacher35@gmail.com")
+            demoted.append(user)
+        return user
+
+    monkeypatch.setattr(schemas.User, "model_validate", load_then_demote)
+    assert client.get("/quizzes/", headers=teacher).status_code == 200 # Authorised by the row it loaded
+    monkeypatch.setattr(schemas.User, "model_validate", validate)
+    assert client.get("/quizzes/", headers=teacher).status_code == 403
+
+def test_answer_key_overtaken_by_an_edit_is_not_cached(monkeypatch):
+    teacher = create_user_with_role("teacher34@gmail.com", "teacher")
+    mock_test = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()
+    test_id = mock_test["id"]
+    reading_id = mock_test["reading_section"]["questions"][0]["id"]
+    compile_key = grading.compile_answer_key
+
+    async def compile_then_edit(db, test_id):
+        # The old key is compiled, then an edit commits and invalidates before
+        # it is cached, as update_mock_test would
+        key = await compile_key(db, test_id)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE mock_test_questions SET correct_answer = 'c' WHERE id = ?", (reading_id,))
+        grading.invalidate_answer_key(test_id)
+        return key
+
+    def submit(answer):
+        submission = {"test_id": test_id, "answers": {"reading": {str(reading_id): answer}}}
+        return client.post(f"/mock-tests/{test_id}/submit", json=submission, headers=teacher).json()["reading_score"]
+
+    monkeypatch.setattr(grading, "compile_answer_key", compile_then_edit)
+    assert submit("d") == 1 # Graded by the key it loaded
+    monkeypatch.setattr(grading, "compile_answer_key", compile_key)
+    assert submit("c") == 1
+
+def test_batch_grading_matches_single_submit():
+    teacher = create_user_with_role("teacher9@gmail.com", "teacher")
+    mock_test = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()
+    test_id = mock_test["id"]
+    l1, l2 = (str(q["id"]) for q in mock_test["listening_section"]["questions"])
+    r1 = str(mock_test["reading_section"]["questions"][0]["id"])
+    answers = [
+        {"listening": {l1: "a", l2: "b"}, "reading": {r1: "d"}},
+        {"listening": {l1: "b", l2: "b"}, "reading": {r1: "x"}},
+        {"listening": {l1: "z", "999999": "a"}}, # An unknown question id is ignored
+        {},
+    ]
+    batch = {"submissions": [{"test_id": test_id, "user_id": i, "answers": a} for i, a in enumerate(answers)]}
+    response = client.post(f"/mock-tests/{test_id}/grade-batch", json=batch, headers=teacher)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["question_ids"] == {"listening": [l1, l2], "reading": [r1]}
+    assert [r["listening_correct"] for r in data["results"]] == [[1, 1], [0, 1], [0, 0], [0, 0]]
+    assert [r["user_id"] for r in data["results"]] == [0, 1, 2, 3]
+
+    for result, submission in zip(data["results"], batch["submissions"]):
+        single = client.post(f"/mock-tests/{test_id}/submit", json=submission, headers=teacher).json()
+        assert (result["listening_score"], result["reading_score"]) == (single["listening_score"], single["reading_score"])
+
+    other = create_user_with_role("teacher10@gmail.com", "teacher")
+    assert client.post(f"/mock-tests/{test_id}/grade-batch", json=batch, headers=other).status_code == 404
+    batch["submissions"][0]["test_id"] = test_id + 1
+    assert client.post(f"/mock-tests/{test_id}/grade-batch", json=batch, headers=teacher).status_code == 400
+    batch["submissions"][0]["answers"] = {"listening": {l1: 1}}
+    response = client.post(f"/mock-tests/{test_id}/grade-batch", json=batch, headers=teacher)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "submissions", 0, "answers", "listening", l1]
+    assert client.post(f"/mock-tests/{test_id}/grade-batch", content=b"{", headers=teacher).status_code == 422
+
+def wait_for_writing_feedback(job_id, headers):
+    import time
+    for _ in range(100):
+        job = client.get(f"/writing-feedback/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"writing feedback job {job_id} did not finish")
+
+def test_writing_feedback_runs_as_background_job():
+    teacher = create_user_with_role("teacher11@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    student = create_user_with_role("student3@gmail.com", "student")
+    response = client.post(
+        f"/mock-tests/{test_id}/submit",
+        json={"test_id": test_id, "answers": {"writing": {"task1": "My essay", "task2": "Another essay"}}},
+        headers=student
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["writing_feedback"] is None
+    job = wait_for_writing_feedback(data["writing_feedback_job_id"], student)
+    assert job["status"] == "done"
+    assert job["feedback"] == {
+        "task1_feedback": "This is a placeholder feedback for Task 1 from Gemini API.",
+        "task2_feedback": "This is a placeholder feedback for Task 2 from Gemini API.",
+        "overall_suggestion": "Overall placeholder suggestion from Gemini API."
+    }
+    # Jobs are only visible to the student who submitted them
+    assert client.get(f"/writing-feedback/{job['id']}", headers=teacher).status_code == 404
+
+def test_writing_feedback_retries_then_fails(monkeypatch):
+    class FlakyGrader:
+        calls = 0
+        def evaluate_task(self, task, prompt, answer):
+            FlakyGrader.calls += 1
+            if FlakyGrader.calls < 2:
+                raise TimeoutError("grader timed out")
+            return {"feedback": f"{task} ok", "suggestion": "Keep going."}
+
+    monkeypatch.setattr(writing.feedback_queue, "grader", FlakyGrader())
+    monkeypatch.setattr(writing.feedback_queue, "backoff", 0)
+    teacher = create_user_with_role("teacher12@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    submission = {"test_id": test_id, "answers": {"writing": {"task1": "Essay"}}}
+
+    job_id = client.post(f"/mock-tests/{test_id}/submit", json=submission, headers=teacher).json()["writing_feedback_job_id"]
+    job = wait_for_writing_feedback(job_id, teacher)
+    assert (job["status"], job["attempts"]) == ("done", 2)
+    assert job["feedback"] == {"task1_feedback": "task1 ok", "task2_feedback": "task2 ok", "overall_suggestion": "Keep going."}
+
+    FlakyGrader.calls = -10
+    submission["answers"]["writing"]["task1"] = "A different essay"
+    job_id = client.post(f"/mock-tests/{test_id}/submit", json=submission, headers=teacher).json()["writing_feedback_job_id"]
+    job = wait_for_writing_feedback(job_id, teacher)
+    assert (job["status"], job["attempts"]) == ("failed", writing.feedback_queue.max_attempts)
+    assert "grader timed out" in job["error"]
+
+def test_writing_feedback_jobs_recovered_after_restart():
+    import time
+    teacher = create_user_with_role("teacher31@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    student = create_user_with_role("student31@gmail.com", "student")
+    student_id = client.get("/users/me/", headers=student).json()["id"]
+    # Left behind by a process that stopped: a job it never started, one it was
+    # running when its claim lapsed, and one still held by a live worker
+    lapsed = time.time() - writing.feedback_queue.claim_timeout - 1
+    jobs = [("queued", 0, None), ("running", 1, lapsed), ("running", 1, time.time())]
+    with engine.begin() as conn:
+        job_ids = [
+            conn.exec_driver_sql(
+                "INSERT INTO writing_feedback_jobs (mock_test_id, user_id, status, attempts, task1_answer, task2_answer, claimed_at) "
+                "VALUES (?, ?, ?, ?, 'Lost essay', '', ?)",
+                (test_id, student_id, *job),
+            ).lastrowid
+            for job in jobs
+        ]
+
+    recovered = writing.feedback_queue.recovered
+    with TestClient(app): # Starting the app runs the recovery sweep
+        queued, interrupted = (wait_for_writing_feedback(job_id, student) for job_id in job_ids[:2])
+    assert (queued["status"], queued["attempts"]) == ("done", 1)
+    # The interrupted attempt is run again rather than counted as spent
+    assert (interrupted["status"], interrupted["attempts"]) == ("done", 1)
+    assert client.get(f"/writing-feedback/{job_ids[2]}", headers=student).json()["status"] == "running"
+    assert writing.feedback_queue.recovered - recovered == 2
+    # A claimed job is never run twice
+    assert writing.feedback_queue.recover() == []
+    assert writing.feedback_queue.claim(job_ids[0]) is None
+
+def test_duplicate_essays_served_from_feedback_cache(monkeypatch):
+    class CountingGrader(writing.StubGrader):
+        calls = []
+        def evaluate_task(self, task, prompt, answer):
+            CountingGrader.calls.append((task, answer))
+            return super().evaluate_task(task, prompt, answer)
+
+    monkeypatch.setattr(writing.feedback_queue, "grader", CountingGrader())
+    teacher = create_user_with_role("teacher13@gmail.com", "teacher")
+    test_id = client.post("/mock-tests/", json=MOCK_TEST_PAYLOAD, headers=teacher).json()["id"]
+    hits = writing.feedback_queue.cache.hits
+
+    feedback = []
+    for task1 in ("The chart shows  growth.", "The chart shows growth. ", "The chart shows decline."):
+        submission = {"test_id": test_id, "answers": {"writing": {"task1": task1, "task2": ""}}}
+        job_id = client.post(f"/mock-tests/{test_id}/submit", json=submission, headers=teacher).json()["writing_feedback_job_id"]
+        feedback.append(wait_for_writing_feedback(job_id, teacher)["feedback"])
+
+    # Whitespace differences normalise to the same essay; the empty task 2 is graded once
+    assert CountingGrader.calls == [
+        ("task1", "The chart shows  growth."), ("task2", ""), ("task1", "The chart shows decline.")
+    ]
+    assert writing.feedback_queue.cache.hits - hits == 3
+    assert feedback[0] == feedback[1] == feedback[2]
+
+def test_feedback_cache_evicts_least_recently_used():
+    cache = writing.FeedbackCache(writing.feedback_queue.session_factory, max_entries=2)
+    for i in range(3):
+        cache.put(f"key{i}", {"feedback": str(i)})
+        cache.get("key0")
+    assert cache.get("key0") == {"feedback": "0"}
+    assert cache.get("key1") is None
+    assert cache.get("key2") == {"feedback": "2"}
+    assert cache.evictions == 1
+
+def test_feedback_cache_counts_rows_only_every_n_puts():
+    cache = writing.FeedbackCache(writing.feedback_queue.session_factory, max_entries=5, recount_every=3)
+    with engine.begin() as conn:
+        # Stored by another process, so only a recount sees them
+        conn.exec_driver_sql("INSERT INTO writing_feedback_cache (key, feedback, hits, last_used) VALUES ('other0', '{}', 0, 0), ('other1', '{}', 0, 0)")
+    with capture_queries(engine) as queries:
+        for i in range(7):
+            cache.put(f"key{i}", {"feedback": str(i)})
+    assert sum("count(*)" in statement for statement, _ in queries) == 2
+    # The recount at the third put picked up the other process's rows, so the
+    # table is held at max_entries from the fourth put on
+    assert cache.evictions == 4
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM writing_feedback_cache").scalar() == 5
+
+def test_sqlite_engine_uses_wal_and_reports_pool_usage():
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1 # NORMAL
+    admin = create_user_with_role("admin5@gmail.com", "admin")
+    stats = client.get("/admin/stats/", headers=admin).json()["database_pool"]
+    assert set(stats) == {"size", "checked_out", "checked_in", "overflow"}
+
+def test_migrations_are_idempotent_and_keep_data(tmp_path):
+    from app import migrations
+
+    migration_engine = make_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    assert migrations.migrate(migration_engine, log=lambda message: None) == [v for v, _, _ in migrations.MIGRATIONS]
+    with migration_engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO users (email, hashed_password, role, disabled) VALUES ('kept@gmail.com', 'x', 'student', 0)")
+    assert migrations.migrate(migration_engine, log=lambda message: None) == []
+    with migration_engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT email FROM users").scalar() == "kept@gmail.com"
+    assert all(applied for _, _, applied in migrations.status(migration_engine))
+    migration_engine.dispose()
+
+def test_migrations_upgrade_older_databases(tmp_path):
+    from app import migrations
+
+    migration_engine = make_engine(f"sqlite:///{tmp_path / 'upgrade.db'}")
+    migrations.migrate(migration_engine, log=lambda message: None)
+    # Roll back to a version 1 database created before the indexes and version columns existed
+    with migration_engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_quizzes_owner_id")
+        conn.exec_driver_sql("DROP INDEX ix_test_results_user_id_id")
+        conn.exec_driver_sql("CREATE INDEX ix_test_results_user_id ON test_results (user_id)")
+        conn.exec_driver_sql("ALTER TABLE quizzes DROP COLUMN version")
+        conn.exec_driver_sql("ALTER TABLE quizzes DROP COLUMN updated_at")
+        conn.exec_driver_sql("INSERT INTO quizzes (title) VALUES ('Old quiz')")
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version > 1")
+    assert migrations.migrate(migration_engine, log=lambda message: None) == [v for v, _, _ in migrations.MIGRATIONS if v > 1]
+    with migration_engine.connect() as conn:
+        assert migrations.has_index(conn, "quizzes", "ix_quizzes_owner_id")
+        assert migrations.has_index(conn, "test_results", "ix_test_results_user_id_id")
+        assert not migrations.has_index(conn, "test_results", "ix_test_results_user_id")
+        version, updated_at = conn.exec_driver_sql("SELECT version, updated_at FROM quizzes").one()
+        assert version == 1 and updated_at is not None
+    migration_engine.dispose()
@@ -0,0 +1,159 @@
+"""Bulk user import for onboarding a school: POST /admin/users/import.
+
+The upload is CSV (a header row naming ``email`` and ``password`` columns, and
+optionally ``re_password``) or NDJSON (one ``{"email": ..., "password": ...}``
+object per line), parsed as it streams in. Rows are checked with the same
+rules as POST /users/ and handled in batches of USER_IMPORT_BATCH_SIZE: the
+batch's passwords are hashed in parallel on ``import_pool``, then its users
+are inserted with one executemany and committed. A bad row never fails the
+import; the report lists every rejected row, by line number, with the reason.
+
+bcrypt dominates the cost, so an import takes about (rows x hash time) /
+workers. ``import_pool`` is separate from ``auth.password_pool`` so an import
+never holds up logins in the admission hash-capacity check.
+"""
+import asyncio
+import csv
+import json
+import os
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from . import auth, metrics, models
+from .pools import WorkerPool
+from .streams import NDJSON_TYPES, content_type, lines
+
+BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", "500"))
+CSV_TYPES = ("text/csv",)
+
+# USER_IMPORT_HASH_WORKERS hashes at once (default: one per core), on
+# USER_IMPORT_HASH_POOL "process" (default) or "thread" workers
+import_pool = WorkerPool(
+    max_workers=int(os.getenv("USER_IMPORT_HASH_WORKERS", "0")) or None,
+    kind=os.getenv("USER_IMPORT_HASH_POOL", "process"),
+)
+
+def credentials(line_number, email, password, re_password):
+    if not isinstance(email, str) or not isinstance(password, str) or not isinstance(re_password, str):
+        return {"line": line_number, "email": email if isinstance(email, str) else None, "error": "email and password must be strings"}
+    return {"line": line_number, "email": email, "password": password, "re_password": re_password}
+
+async def csv_rows(stream):
+    columns = None
+    line_number = 0
+    async for line in lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if columns is None:
+            columns = [name.strip().lower() for name in values]
+            if "email" not in columns or "password" not in columns:
+                raise HTTPException(status_code=400, detail="CSV header must name email and password columns")
+            continue
+        if len(values) != len(columns):
+            yield {"line": line_number, "email": None, "error": f"Expected {len(columns)} columns, got {len(values)}"}
+            continue
+        row = dict(zip(columns, values))
+        yield credentials(line_number, row["email"], row["password"], row.get("re_password", row["password"]))
+
+async def ndjson_rows(stream):
+    line_number = 0
+    async for line in lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield {"line": line_number, "email": None, "error": "Invalid JSON"}
+            continue
+        if not isinstance(row, dict):
+            yield {"line": line_number, "email": None, "error": "Expected a JSON object"}
+            continue
+        password = row.get("password")
+        yield credentials(line_number, row.get("email"), password, row.get("re_password", password))
+
+def read_rows(request):
+    """The upload's rows, parsed by its Content-Type as they arrive."""
+    upload_type = content_type(request)
+    if upload_type in CSV_TYPES:
+        return csv_rows(request.stream())
+    if upload_type in NDJSON_TYPES:
+        return ndjson_rows(request.stream())
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Upload users as text/csv or application/x-ndjson",
+    )
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+        self.seen = set() # Emails already taken by an earlier row of the upload
+
+    def reject(self, row, detail):
+        self.errors.append({"line": row["line"], "email": row["email"], "detail": detail})
+
+    def as_dict(self):
+        errors = sorted(self.errors, key=lambda error: error["line"])
+        return {"created": self.created, "failed": len(errors), "errors": errors}
+
+async def registered(db, emails):
+    if not emails:
+        return set()
+    return set(await db.scalars(select(models.User.email).where(models.User.email.in_(emails))))
+
+async def import_batch(db, batch, report):
+    valid = []
+    for row in batch:
+        error = row.get("error") or auth.new_user_error(row["email"], row["password"], row["re_password"])
+        if error is None and row["email"] in report.seen:
+            error = "Email appears more than once in the upload"
+        if error:
+            report.reject(row, error)
+            continue
+        report.seen.add(row["email"])
+        valid.append(row)
+    taken = await registered(db, [row["email"] for row in valid])
+    for row in valid:
+        if row["email"] in taken:
+            report.reject(row, "Email already registered")
+    valid = [row for row in valid if row["email"] not in taken]
+    if not valid:
+        return
+
+    with metrics.time_password_hash():
+        hashes = await asyncio.gather(*(import_pool.run(auth.get_password_hash, row["password"]) for row in valid))
+    users = [{"email": row["email"], "hashed_password": hashed} for row, hashed in zip(valid, hashes)]
+    try:
+        await db.execute(insert(models.User), users)
+        await db.commit()
+    except IntegrityError:
+        # Someone registered one of these emails since the check; retry without them
+        await db.rollback()
+        taken = await registered(db, [row["email"] for row in valid])
+        for row in valid:
+            if row["email"] in taken:
+                report.reject(row, "Email already registered")
+        users = [user for user in users if user["email"] not in taken]
+        if users:
+            await db.execute(insert(models.User), users)
+            await db.commit()
+    report.created += len(users)
+
+async def import_users(db, rows, batch_size=None):
+    """Create a student for every acceptable row; returns counts and the rejected rows."""
+    batch_size = batch_size or BATCH_SIZE
+    report = ImportReport()
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await import_batch(db, batch, report)
+            batch = []
+    if batch:
+        await import_batch(db, batch, report)
+    return report.as_dict()
@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .database import SessionLocal
+
+WRITING_TASKS = ("task1", "task2")
+
+# Graders evaluate one task at a time and return {"feedback": str, "suggestion": str}
+
+class StubGrader:
+    """Deterministic grader used by default and in tests; makes no external calls."""
+
+    def evaluate_task(self, task, prompt, answer):
+        return {
+            "feedback": f"This is a placeholder feedback for Task {task[-1]} from Gemini API.",
+            "suggestion": "Overall placeholder suggestion from Gemini API.",
+        }
+
+class GeminiGrader:
+    """Evaluates essays with the Gemini API (google-generativeai)."""
+
+    PROMPT = (
+        "You are an IELTS writing examiner. Evaluate the answer to the task below and reply "
+        'with JSON of the form {{"feedback": str, "suggestion": str}}.\n\n'
+        "Task: {prompt}\nAnswer: {answer}\n"
+    )
+
+    def __init__(self, api_key, model="gemini-1.5-flash"):
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # The generative-AI stack is slow to import, so load it on first use
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._client = genai.GenerativeModel(self.model, generation_config={"response_mime_type": "application/json"})
+        return self._client
+
+    def evaluate_task(self, task, prompt, answer):
+        prompt = self.PROMPT.format(prompt=prompt or "", answer=answer or "")
+        return json.loads(self.client.generate_content(prompt).text)
+
+def get_grader():
+    # WRITING_GRADER selects the backend: "stub" (default) or "gemini"
+    if os.getenv("WRITING_GRADER", "stub") == "gemini":
+        return GeminiGrader(os.environ["GEMINI_API_KEY"], model=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+    return StubGrader()
+
+def normalize_answer(text):
+    # Essays differing only in whitespace or Unicode form get the same feedback
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+class FeedbackCache:
+    """Persistent, size-bounded store of per-task writing feedback.
+
+    Entries are addressed by a hash of the mock test, task, task prompt and
+    normalised answer, so duplicate essays are served without calling the
+    grader. When the table grows past ``max_entries`` the least recently used
+    entries are evicted, a tenth of the cache at a time.
+
+    Counting the table is a scan, so the size is tracked in memory from this
+    process's own inserts and evictions. It is corrected by a real count every
+    ``recount_every`` puts, which also picks up other processes' inserts; until
+    then the table can overshoot by that many entries per process.
+    """
+
+    def __init__(self, session_factory, max_entries=50000, recount_every=1000):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.recount_every = recount_every
+        self._lock = threading.Lock()
+        self._size = 0 # Estimated rows in the table
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(mock_test_id, task, prompt, answer):
+        content = "\0".join([str(mock_test_id), task, normalize_answer(prompt), normalize_answer(answer)])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.session_factory() as db:
+            entry = db.get(models.WritingFeedbackCacheEntry, key)
+            if entry is not None:
+                entry.hits += 1
+                entry.last_used = time.time()
+                db.commit()
+                feedback = json.loads(entry.feedback)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return feedback
+
+    def put(self, key, feedback):
+        with self.session_factory() as db:
+            db.add(models.WritingFeedbackCacheEntry(key=key, feedback=json.dumps(feedback), hits=0, last_used=time.time()))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker stored the same essay first
+                db.rollback()
+                return
+            with self._lock:
+                self._size += 1
+                self._puts += 1
+                size = self._size
+                recount = self._puts % self.recount_every == 0
+            if recount:
+                size = db.scalar(select(func.count()).select_from(models.WritingFeedbackCacheEntry))
+            excess = size - self.max_entries
+            evicted = 0
+            if excess > 0:
+                oldest = (
+                    select(models.WritingFeedbackCacheEntry.key)
+                    .order_by(models.WritingFeedbackCacheEntry.last_used)
+                    .limit(excess + self.max_entries // 10)
+                )
+                evicted = db.execute(delete(models.WritingFeedbackCacheEntry).where(models.WritingFeedbackCacheEntry.key.in_(oldest))).rowcount
+                db.commit()
+            if recount or evicted:
+                with self._lock:
+                    self._size = size - evicted
+                    self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+class FeedbackJobQueue:
+    """Runs writing evaluations for WritingFeedbackJob rows on a bounded thread pool.
+
+    Job state lives in the database, so any worker process can answer a status
+    poll. A failed evaluation is retried up to ``max_attempts`` times with
+    exponential backoff before the job is marked failed.
+
+    A worker claims a job before running it by stamping ``claimed_at``, and
+    refreshes the stamp on every attempt. A job that is still queued or running
+    with no claim, or with one older than ``claim_timeout`` seconds, was lost
+    with the process that held it (a restart or deploy). ``recover`` picks
+    such jobs up again; ``sweep`` runs it at startup and then periodically.
+    """
+
+    def __init__(self, grader, session_factory=SessionLocal, max_workers=4, max_attempts=3, backoff=1.0, cache_size=50000, claim_timeout=300.0):
+        self.grader = grader
+        self.cache = FeedbackCache(session_factory, max_entries=cache_size)
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.claim_timeout = claim_timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._held = set() # Job ids enqueued in this process and not finished yet
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.recovered = 0
+
+    @property
+    def session_factory(self):
+        return self.cache.session_factory
+
+    @session_factory.setter
+    def session_factory(self, session_factory):
+        self.cache.session_factory = session_factory
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="writing-feedback")
+        return self._executor
+
+    def enqueue(self, job_id):
+        with self._lock:
+            self.pending += 1
+            self._held.add(job_id)
+        return self.executor.submit(self.process, job_id)
+
+    def process(self, job_id):
+        try:
+            first = self.claim(job_id)
+            if first is None:
+                return
+            for attempt in range(first, self.max_attempts + 1):
+                if self._attempt(job_id, attempt):
+                    return
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self._held.discard(job_id)
+
+    def claimable(self, now):
+        job = models.WritingFeedbackJob
+        return job.status.in_(("queued", "running")) & or_(job.claimed_at.is_(None), job.claimed_at < now - self.claim_timeout)
+
+    def claim(self, job_id):
+        """Take the job for this worker; returns the attempt to run next, or None
+        if the job is finished, gone or held by another live worker."""
+        now = time.time()
+        job = models.WritingFeedbackJob
+        with self.session_factory() as db:
+            # One conditional UPDATE, so two processes never both claim a job
+            claimed = db.execute(update(job).where(job.id == job_id, self.claimable(now)).values(claimed_at=now)).rowcount
+            db.commit()
+            if not claimed:
+                return None
+            status, attempts = db.execute(select(job.status, job.attempts).where(job.id == job_id)).one()
+        # A job lost while running gets that attempt again
+        return max(1, min(attempts if status == "running" else attempts + 1, self.max_attempts))
+
+    def recover(self):
+        """Enqueue every unfinished job without a live claim; returns their ids."""
+        job = models.WritingFeedbackJob
+        with self.session_factory() as db:
+            job_ids = db.scalars(select(job.id).where(self.claimable(time.time())).order_by(job.id)).all()
+        with self._lock:
+            job_ids = [job_id for job_id in job_ids if job_id not in self._held]
+            self.recovered += len(job_ids)
+        for job_id in job_ids:
+            self.enqueue(job_id)
+        return job_ids
+
+    async def sweep(self):
+        """Recover lost jobs now and then every ``claim_timeout`` seconds; runs
+        for the lifetime of the app."""
+        while True:
+            await asyncio.to_thread(self.recover)
+            await asyncio.sleep(self.claim_timeout)
+
+    def _attempt(self, job_id, attempt):
+        """Run one evaluation; returns True once the job is finished either way."""
+        with self.session_factory() as db:
+            job = db.get(models.WritingFeedbackJob, job_id)
+            if job is None:
+                return True
+            job.status = "running"
+            job.attempts = attempt
+            job.claimed_at = time.time()
+            db.commit()
+            section = db.scalar(
+                select(models.MockTestSection)
+                .where(models.MockTestSection.mock_test_id == job.mock_test_id, models.MockTestSection.title == "writing")
+            )
+            try:
+                results = [
+                    self._evaluate_task(job.mock_test_id, task, getattr(section, task, None), getattr(job, f"{task}_answer"))
+                    for task in WRITING_TASKS
+                ]
+            except Exception as e:
+                job.error = repr(e)
+                finished = attempt >= self.max_attempts
+                job.status = "failed" if finished else "queued"
+                job.claimed_at = time.time() # Still held through the backoff
+                db.commit()
+                with self._lock:
+                    if finished:
+                        self.failed += 1
+                    else:
+                        self.retries += 1
+                return finished
+            feedback = {f"{task}_feedback": result["feedback"] for task, result in zip(WRITING_TASKS, results)}
+            feedback["overall_suggestion"] = " ".join(dict.fromkeys(result["suggestion"] for result in results))
+            job.status = "done"
+            job.feedback = json.dumps(feedback)
+            job.error = None
+            db.commit()
+            with self._lock:
+                self.completed += 1
+            return True
+
+    def _evaluate_task(self, mock_test_id, task, prompt, answer):
+        key = self.cache.key(mock_test_id, task, prompt, answer)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.grader.evaluate_task(task, prompt, answer)
+            self.cache.put(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "recovered": self.recovered,
+                "cache": self.cache.stats(),
+            }
+
+feedback_queue = FeedbackJobQueue(
+    get_grader(),
+    max_workers=int(os.getenv("WRITING_FEEDBACK_WORKERS", "4")),
+    max_attempts=int(os.getenv("WRITING_FEEDBACK_MAX_ATTEMPTS", "3")),
+    backoff=float(os.getenv("WRITING_FEEDBACK_BACKOFF", "1.0")),
+    cache_size=int(os.getenv("WRITING_FEEDBACK_CACHE_SIZE", "50000")),
+    claim_timeout=float(os.getenv("WRITING_FEEDBACK_CLAIM_TIMEOUT", "300")),
+)
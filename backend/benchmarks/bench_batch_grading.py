@@ -0,0 +1,110 @@
+"""Batch grading throughput: grading.grade_batch alone and the full endpoint.
+
+    cd backend && python -m benchmarks.bench_batch_grading --submissions 10000
+
+Exits non-zero if the endpoint's median time is over --budget seconds. The request
+body is serialised before the clock starts, so the time is the server's:
+parsing, grading and writing the response.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import auth, grading, models
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+OPTIONS = ["A", "B", "C", "D"]
+
+
+def seed(questions):
+    migrate(log=lambda message: None)
+    db = SessionLocal()
+    teacher = models.User(email="bench-teacher@gmail.com", hashed_password="x", role="teacher")
+    mock_test = models.MockTest(title="Bench", owner=teacher)
+    for title in grading.GRADED_SECTIONS:
+        section = models.MockTestSection(title=title, mock_test=mock_test)
+        section.questions = [
+            models.MockTestQuestion(text=f"{title} {i}", options=OPTIONS, correct_answer=random.choice(OPTIONS))
+            for i in range(questions)
+        ]
+    db.add(mock_test)
+    db.flush()
+    question_ids = {
+        section.title: [str(q.id) for q in section.questions] for section in mock_test.sections
+    }
+    test_id = mock_test.id
+    db.commit()
+    db.close()
+    return test_id, question_ids, auth.create_access_token(data={"sub": "bench-teacher@gmail.com"})
+
+
+def random_submissions(test_id, question_ids, count):
+    return [
+        {
+            "test_id": test_id,
+            "user_id": i,
+            "answers": {
+                title: {qid: random.choice(OPTIONS) for qid in ids if random.random() < 0.95}
+                for title, ids in question_ids.items()
+            },
+        }
+        for i in range(count)
+    ]
+
+
+async def main(args):
+    random.seed(0)
+    test_id, question_ids, token = seed(args.questions)
+    submissions = random_submissions(test_id, question_ids, args.submissions)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        response = await client.post(f"/mock-tests/{test_id}/grade-batch", json={"submissions": submissions[:10]}, headers=headers)
+        response.raise_for_status()
+
+        async with AsyncSessionLocal() as db:
+            answer_key = await grading.get_answer_key(db, test_id)
+        answers = [s["answers"] for s in submissions]
+        core = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            grading.grade_batch(answer_key, answers)
+            core.append(time.perf_counter() - start)
+
+        body = json.dumps({"submissions": submissions}).encode()
+        endpoint = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            response = await client.post(
+                f"/mock-tests/{test_id}/grade-batch", content=body, headers={**headers, "Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+            endpoint.append(time.perf_counter() - start)
+    core, endpoint = statistics.median(core), statistics.median(endpoint)
+
+    print(f"{args.submissions} submissions x {2 * args.questions} questions")
+    print(f"  grade_batch: {core * 1000:8.1f} ms (median of {args.repeat})")
+    print(f"  endpoint:    {endpoint * 1000:8.1f} ms (request parsing and response included)")
+    await async_engine.dispose()
+    if endpoint > args.budget:
+        sys.exit(f"FAIL: the endpoint took {endpoint:.2f} s, over the {args.budget:.2f} s budget")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--questions", type=int, default=40, help="per section")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.75, help="seconds allowed for the endpoint (median)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""Time to create mock tests of increasing size through POST /mock-tests/.
+
+    cd backend && python -m benchmarks.bench_bulk_create --sizes 10 100 1000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import auth, models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+
+def seed():
+    migrate(log=lambda message: None)
+    db = SessionLocal()
+    db.add(models.User(email="bench-teacher@gmail.com", hashed_password="x", role="teacher"))
+    db.commit()
+    db.close()
+    return auth.create_access_token(data={"sub": "bench-teacher@gmail.com"})
+
+
+def mock_test_payload(questions):
+    def section_questions(prefix, count):
+        return [
+            {"text": f"{prefix} question {i}", "options": ["A", "B", "C", "D"], "correct_answer": "A"}
+            for i in range(count)
+        ]
+
+    listening = questions // 2
+    return {
+        "title": f"Mock test with {questions} questions",
+        "description": "bench",
+        "listening_section": {"title": "listening", "questions": section_questions("Listening", listening)},
+        "reading_section": {
+            "title": "reading",
+            "passage": "A passage " * 500,
+            "questions": section_questions("Reading", questions - listening),
+        },
+        "writing_section": {"title": "writing", "task1": "Task 1", "task2": "Task 2"},
+    }
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {seed()}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        print(f"{'questions':>10} {'ms/test':>10} {'ms/question':>12}")
+        for size in args.sizes:
+            payload = mock_test_payload(size)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                (await client.post("/mock-tests/", json=payload, headers=headers)).raise_for_status()
+            elapsed = (time.perf_counter() - start) / args.repeat * 1000
+            print(f"{size:>10} {elapsed:>10.1f} {elapsed / size:>12.3f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""Worker cold-start time: a fresh interpreter importing app.main.
+
+    cd backend && python -m benchmarks.bench_cold_start            # measure
+    cd backend && python -m benchmarks.bench_cold_start --save     # record baseline
+    cd backend && python -m benchmarks.bench_cold_start --check    # fail on regression
+
+The baseline is tracked in benchmarks/baselines/cold_start.json. Absolute numbers
+depend on the machine, so re-save it when moving to different hardware.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "cold_start.json")
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure(runs):
+    env = dict(os.environ, SQLITE_DB_PATH=os.path.join(tempfile.mkdtemp(), "cold.db"), PYTHONWARNINGS="ignore")
+    import_times, process_times = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+            check=True, capture_output=True, text=True,
+        ).stdout
+        process_times.append(time.perf_counter() - start)
+        import_times.append(float(output.strip().splitlines()[-1]))
+    return {
+        "import_median_ms": round(statistics.median(import_times) * 1000, 1),
+        "process_median_ms": round(statistics.median(process_times) * 1000, 1),
+        "runs": runs,
+    }
+
+
+def main(args):
+    result = measure(args.runs)
+    print(f"import app.main: {result['import_median_ms']} ms, whole process: {result['process_median_ms']} ms "
+          f"(median of {args.runs})")
+    if args.save:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {BASELINE_PATH}")
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        limit = baseline["import_median_ms"] * (1 + args.threshold)
+        if result["import_median_ms"] > limit:
+            print(f"REGRESSION: {result['import_median_ms']} ms > {limit:.1f} ms "
+                  f"(baseline {baseline['import_median_ms']} ms + {args.threshold:.0%})")
+            sys.exit(1)
+        print(f"OK: within {args.threshold:.0%} of baseline {baseline['import_median_ms']} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    main(parser.parse_args())
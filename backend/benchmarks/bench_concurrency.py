@@ -0,0 +1,81 @@
+"""Requests per second against the read endpoints at increasing client concurrency.
+
+Runs fully in-process against a throwaway SQLite database:
+
+    cd backend && python -m benchmarks.bench_concurrency
+
+Pass --base-url to drive an already running server instead (e.g. uvicorn with
+several workers), in which case the server's own database must hold the seed data.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import auth, models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+
+def seed(quizzes, questions):
+    migrate(log=lambda message: None)
+    db = SessionLocal()
+    teacher = models.User(email="bench-teacher@gmail.com", hashed_password="x", role="teacher")
+    db.add(teacher)
+    db.flush()
+    for i in range(quizzes):
+        quiz = models.Quiz(title=f"Quiz {i}", description="bench", owner_id=teacher.id)
+        quiz.questions = [
+            models.Question(text=f"Question {j}", options=["a", "b", "c", "d"], correct_answer="a")
+            for j in range(questions)
+        ]
+        db.add(quiz)
+    db.commit()
+    db.close()
+    return auth.create_access_token(data={"sub": "bench-teacher@gmail.com"})
+
+
+async def run_level(client, path, headers, concurrency, total):
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    token = seed(args.quizzes, args.questions)
+    headers = {"Authorization": f"Bearer {token}"}
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    async with client:
+        await run_level(client, args.path, headers, 1, 10)  # warm up
+        print(f"{'clients':>8} {'req/s':>10}")
+        for concurrency in args.concurrency:
+            rps = await run_level(client, args.path, headers, concurrency, args.requests)
+            print(f"{concurrency:>8} {rps:>10.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/quizzes/1")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--quizzes", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--base-url")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,228 @@
+"""Load test: concurrent student sessions over the main flows, with per-route latency.
+
+Seeds a throwaway SQLite database with thousands of users and hundreds of mock
+tests (40-question listening and reading sections), then runs --sessions
+student sessions, --concurrency at a time. Each session logs in, then
+--iterations times fetches a mock test, submits answers, stores the result and
+lists its results. Mock tests are only readable by their owning teacher, so
+the fetches use the owner's token.
+
+    cd backend && python -m benchmarks.bench_load
+    cd backend && python -m benchmarks.bench_load --save     # record baseline
+    cd backend && python -m benchmarks.bench_load --check    # fail on regression
+
+Reports requests/s and p50/p95/p99 latency per route. Admission control is
+lifted so logins measure bcrypt rather than the rate limits. The baseline is
+tracked in benchmarks/baselines/load.json and, like the cold-start baseline, is
+specific to the machine it was recorded on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+from sqlalchemy import insert
+
+from app import admission, auth, models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "load.json")
+OPTIONS = ["A", "B", "C", "D"]
+PASSWORD = "Bench1234"
+SECTIONS = ("listening", "reading", "writing")
+
+
+def seed(args, rng):
+    """Bulk-load users and mock tests with known ids; returns {test_id: {section: [question ids]}}."""
+    migrate(log=lambda message: None)
+    hashed_password = auth.get_password_hash(PASSWORD)  # One hash shared by every seeded user
+    teachers = [{"id": i + 1, "email": f"teacher{i}@gmail.com", "hashed_password": hashed_password, "role": "teacher", "disabled": 0} for i in range(args.teachers)]
+    students = [
+        {"id": args.teachers + i + 1, "email": f"student{i}@gmail.com", "hashed_password": hashed_password, "role": "student", "disabled": 0}
+        for i in range(args.users)
+    ]
+    tests, sections, questions, layout = [], [], [], {}
+    for test_id in range(1, args.mock_tests + 1):
+        tests.append({"id": test_id, "title": f"Mock {test_id}", "description": "bench", "owner_id": (test_id - 1) % args.teachers + 1})
+        layout[test_id] = {}
+        for offset, title in enumerate(SECTIONS):
+            section_id = (test_id - 1) * len(SECTIONS) + offset + 1
+            sections.append({
+                "id": section_id,
+                "title": title,
+                "passage": "Reading passage. " * 200 if title == "reading" else None,
+                "task1": "Describe the chart." if title == "writing" else None,
+                "task2": "Discuss both views." if title == "writing" else None,
+                "mock_test_id": test_id,
+            })
+            if title == "writing":
+                continue
+            ids = []
+            for _ in range(args.questions):
+                ids.append(len(questions) + 1)
+                questions.append({"id": ids[-1], "text": f"{title} question", "options": OPTIONS, "correct_answer": rng.choice(OPTIONS), "section_id": section_id})
+            layout[test_id][title] = ids
+    with SessionLocal() as db:
+        db.execute(insert(models.User), teachers + students)
+        db.execute(insert(models.MockTest), tests)
+        db.execute(insert(models.MockTestSection), sections)
+        db.execute(insert(models.MockTestQuestion), questions)
+        db.commit()
+    teacher_tokens = {t["id"]: {"Authorization": f"Bearer {auth.create_access_token(data={'sub': t['email']})}"} for t in teachers}
+    return layout, tests, teacher_tokens
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def session(client, recorder, args, rng, layout, tests, teacher_tokens):
+    email = f"student{rng.randrange(args.users)}@gmail.com"
+    response = await recorder.request(client, "POST /token", "POST", "/token", data={"username": email, "password": PASSWORD})
+    if response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for _ in range(args.iterations):
+        test = rng.choice(tests)
+        test_id = test["id"]
+        await recorder.request(client, "GET /mock-tests/{id}", "GET", f"/mock-tests/{test_id}", headers=teacher_tokens[test["owner_id"]])
+        answers = {section: {str(qid): rng.choice(OPTIONS) for qid in ids} for section, ids in layout[test_id].items()}
+        answers["writing"] = {"task1": "My essay about the chart.", "task2": "My essay about both views."}
+        response = await recorder.request(
+            client, "POST /mock-tests/{id}/submit", "POST", f"/mock-tests/{test_id}/submit",
+            json={"test_id": test_id, "answers": answers}, headers=headers,
+        )
+        if response.status_code != 200:
+            continue
+        graded = response.json()
+        result = {
+            "mock_test_id": test_id,
+            "user_id": 0,
+            "listening_score": graded["listening_score"],
+            "reading_score": graded["reading_score"],
+            "writing_feedback": None,
+            "total_questions_listening": graded["total_questions_listening"],
+            "total_questions_reading": graded["total_questions_reading"],
+        }
+        await recorder.request(client, "POST /test-results/", "POST", "/test-results/", json=result, headers=headers)
+        await recorder.request(client, "GET /test-results/me/", "GET", "/test-results/me/", headers=headers)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    layout, tests, teacher_tokens = seed(args, rng)
+    unlimited = admission.Rule(rate=1e9, burst=10**9)
+    admission.configure(ip_rule=unlimited, account_rule=unlimited, max_pending_hashes=10**9)
+    recorder = Recorder()
+    remaining = iter(range(args.sessions))
+
+    async def virtual_user(client):
+        for _ in remaining:
+            await session(client, recorder, args, rng, layout, tests, teacher_tokens)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(virtual_user(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+
+    routes = {}
+    for route, samples in recorder.latencies.items():
+        routes[route] = {
+            "count": len(samples),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+            "errors": recorder.errors.get(route, 0),
+        }
+    return {"config": config(args), "elapsed_s": round(elapsed, 1), "routes": routes}
+
+
+def config(args):
+    return {name: getattr(args, name) for name in ("users", "teachers", "mock_tests", "questions", "sessions", "iterations", "concurrency", "seed")}
+
+
+def report(result):
+    print(f"{'route':<30} {'count':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}  (ms)")
+    for route, stats in result["routes"].items():
+        print(f"{route:<30} {stats['count']:>7} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>7}")
+    print(f"{result['elapsed_s']} s in total")
+
+
+def regressions(result, baseline, threshold):
+    found = []
+    for route, base in baseline["routes"].items():
+        current = result["routes"].get(route)
+        if current is None:
+            found.append(f"{route}: no requests")
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            found.append(f"{route}: p95 {current['p95_ms']} ms > {base['p95_ms']} ms + {threshold:.0%}")
+        if current["rps"] < base["rps"] * (1 - threshold):
+            found.append(f"{route}: {current['rps']} req/s < {base['rps']} req/s - {threshold:.0%}")
+        if current["errors"] > base["errors"]:
+            found.append(f"{route}: {current['errors']} errors (baseline {base['errors']})")
+    return found
+
+
+def main(args):
+    result = asyncio.run(run(args))
+    report(result)
+    if args.save:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {BASELINE_PATH}")
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if baseline["config"] != result["config"]:
+            print(f"WARNING: baseline was recorded with {baseline['config']}")
+        found = regressions(result, baseline, args.threshold)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        if found:
+            sys.exit(1)
+        print(f"OK: every route within {args.threshold:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000, help="students")
+    parser.add_argument("--teachers", type=int, default=20)
+    parser.add_argument("--mock-tests", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=40, help="per listening/reading section")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=5, help="mock tests taken per session")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    main(parser.parse_args())
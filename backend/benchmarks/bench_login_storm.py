@@ -0,0 +1,127 @@
+"""Login storm: many concurrent /token requests while other routes keep being served.
+
+Reports login throughput and the latency of a cheap probe route measured during
+the storm, for each password pool size. ``--workers 0`` verifies passwords inline
+on the event loop, which is how logins behaved before the pool existed.
+Admission control is lifted unless ``--admission`` is given, in which case the
+default limits apply and rejected (429) logins are counted.
+
+    cd backend && python -m benchmarks.bench_login_storm --users 64 --workers 0 1 4
+    cd backend && python -m benchmarks.bench_login_storm --users 256 --admission
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import admission, auth, models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+
+class InlinePool:
+    """Stand-in for auth.password_pool that blocks the event loop."""
+
+    max_workers = 1
+    in_flight = completed = 0
+    total_seconds = 0.0
+
+    async def run(self, func, *args):
+        return func(*args)
+
+    def shutdown(self):
+        pass
+
+
+def seed(users):
+    migrate(log=lambda message: None)
+    hashed_password = auth.get_password_hash("Test1234")
+    db = SessionLocal()
+    db.add_all(
+        models.User(email=f"storm{i}@gmail.com", hashed_password=hashed_password)
+        for i in range(users)
+    )
+    db.commit()
+    db.close()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def storm(client, users, pool_kind, workers, limited):
+    if workers:
+        auth.configure_password_pool(max_workers=workers, kind=pool_kind)
+    else:
+        auth.password_pool.shutdown()
+        auth.password_pool = InlinePool()
+    if limited:
+        admission.configure()
+    else:
+        unlimited = admission.Rule(rate=1e9, burst=10**9)
+        admission.configure(ip_rule=unlimited, account_rule=unlimited, max_pending_hashes=10**9)
+
+    rejected = 0
+    login_latencies = []
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async def login(i):
+        nonlocal rejected
+        start = time.perf_counter()
+        response = await client.post("/token", data={"username": f"storm{i}@gmail.com", "password": "Test1234"})
+        if response.status_code == 429:
+            rejected += 1
+            return
+        response.raise_for_status()
+        login_latencies.append(time.perf_counter() - start)
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            (await client.get("/")).raise_for_status()
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    auth.password_pool.shutdown()
+
+    ms = lambda seconds: seconds * 1000
+    print(
+        f"{workers or 'inline':>8} {len(login_latencies) / elapsed:>10.1f} {rejected:>9} "
+        f"{ms(percentile(login_latencies, 50)):>10.0f} {ms(percentile(login_latencies, 95)):>10.0f} "
+        f"{ms(statistics.median(probe_latencies)):>10.1f} {ms(percentile(probe_latencies, 95)):>10.1f} "
+        f"{ms(max(probe_latencies)):>10.1f}"
+    )
+
+
+async def main(args):
+    seed(args.users)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        print(f"{'workers':>8} {'logins/s':>10} {'rejected':>9} {'login p50':>10} {'login p95':>10} "
+              f"{'probe p50':>10} {'probe p95':>10} {'probe max':>10}  (ms)")
+        for workers in args.workers:
+            await storm(client, args.users, args.pool, workers, args.admission)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({0, 1, os.cpu_count() or 1}))
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--admission", action="store_true", help="apply the default admission limits")
+    asyncio.run(main(parser.parse_args()))
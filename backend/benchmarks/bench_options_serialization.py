@@ -0,0 +1,79 @@
+"""Question options: legacy JSON-string column vs. the JSON column, read and serialised.
+
+    cd backend && python -m benchmarks.bench_options_serialization --questions 40
+
+Each round reads one section's questions and validates them into response
+schemas, the work a mock-test read does per section.
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import JSON, Column, Integer, MetaData, String, Table, create_engine, insert, select
+
+from app import schemas
+from app.schemas import parse_json_field
+
+metadata = MetaData()
+legacy = Table(
+    "legacy_questions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("text", String),
+    Column("options", String),
+    Column("correct_answer", String),
+    Column("section_id", Integer),
+)
+native = Table(
+    "native_questions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("text", String),
+    Column("options", JSON),
+    Column("correct_answer", String),
+    Column("section_id", Integer),
+)
+
+
+def run(conn, table, rounds, parse):
+    query = select(table)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for row in conn.execute(query).mappings():
+            row = dict(row)
+            if parse:
+                row["options"] = parse_json_field(row["options"])
+            schemas.MockTestQuestion.model_validate(row)
+    return (time.perf_counter() - start) / rounds
+
+
+def main(args):
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    questions = [
+        {"text": f"Question {i}", "options": [f"Option {j}" for j in range(args.options)], "correct_answer": "Option 0", "section_id": 1}
+        for i in range(args.questions)
+    ]
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        conn.execute(insert(legacy), [{**q, "options": json.dumps(q["options"])} for q in questions])
+        legacy_insert = time.perf_counter() - start
+        start = time.perf_counter()
+        conn.execute(insert(native), questions)
+        native_insert = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        run(conn, native, 10, parse=False)  # warm up
+        legacy_read = run(conn, legacy, args.rounds, parse=True)
+        native_read = run(conn, native, args.rounds, parse=False)
+
+    print(f"{args.questions} questions x {args.options} options, {args.rounds} rounds")
+    print(f"  insert  legacy: {legacy_insert * 1000:8.2f} ms   json column: {native_insert * 1000:8.2f} ms")
+    print(f"  read    legacy: {legacy_read * 1000:8.2f} ms   json column: {native_read * 1000:8.2f} ms (per section)")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=40, help="per section")
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Question-bank import and export throughput, and peak Python memory, at increasing bank sizes.
+
+    cd backend && python -m benchmarks.bench_question_bank --sizes 50 500 2000
+
+Each size is a bank of that many 80-question mock tests with a reading
+passage. Peak memory (tracemalloc) should stay roughly flat as the bank grows,
+since both directions hold one mock test at a time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import auth, models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+from benchmarks.bench_bulk_create import mock_test_payload
+
+
+def seed(teachers):
+    migrate(log=lambda message: None)
+    db = SessionLocal()
+    emails = [f"bank-teacher{i}@gmail.com" for i in range(teachers)]
+    db.add_all(models.User(email=email, hashed_password="x", role="teacher") for email in emails)
+    db.commit()
+    db.close()
+    return [{"Authorization": f"Bearer {auth.create_access_token(data={'sub': email})}"} for email in emails]
+
+
+async def bank(size):
+    line = json.dumps({"type": "mock_test", **mock_test_payload(80)}) + "\n"
+    for _ in range(size):
+        yield line.encode()
+
+
+async def export(headers):
+    """Drive the export through the ASGI app, counting lines as they are sent.
+
+    httpx's ASGI transport buffers whole responses, which would hide whether
+    the export itself streams.
+    """
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "root_path": "",
+        "path": "/question-bank/export", "raw_path": b"/question-bank/export", "query_string": b"",
+        "headers": [(b"authorization", headers["Authorization"].encode())],
+        "server": ("bench", 80), "client": ("127.0.0.1", 0),
+    }
+    requested = False
+    lines = 0
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait() # The client never disconnects
+
+    async def send(message):
+        nonlocal lines
+        if message["type"] == "http.response.body":
+            lines += message.get("body", b"").count(b"\n")
+
+    await app(scope, receive, send)
+    return lines
+
+
+async def main(args):
+    teachers = seed(len(args.sizes))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        print(f"{'mock tests':>10} {'import/s':>10} {'import peak MB':>15} {'export/s':>10} {'export peak MB':>15}")
+        for size, headers in zip(args.sizes, teachers):
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = await client.post("/question-bank/import", content=bank(size), headers={**headers, "Content-Type": "application/x-ndjson"})
+            response.raise_for_status()
+            import_rate = size / (time.perf_counter() - start)
+            import_peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            exported = await export(headers)
+            export_rate = exported / (time.perf_counter() - start)
+            export_peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            print(f"{size:>10} {import_rate:>10.1f} {import_peak:>15.1f} {export_rate:>10.1f} {export_peak:>15.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000])
+    asyncio.run(main(parser.parse_args()))
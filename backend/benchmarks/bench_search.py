@@ -0,0 +1,99 @@
+"""Full-text search latency over a large question bank.
+
+Seeds --teachers teachers whose mock tests hold --questions questions in all
+(plus a passage and writing tasks per test). The text is drawn from a
+vocabulary with natural, Zipf-distributed word frequencies. The index is built
+with search.rebuild, then GET /search is timed as one teacher for very common
+to rare words, alone and combined.
+
+    cd backend && python -m benchmarks.bench_search --questions 300000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+from sqlalchemy import insert
+
+from app import auth, models, search
+from app.database import SessionLocal, async_engine, engine
+from app.main import app
+from app.migrations import migrate
+from benchmarks.bench_load import percentile
+
+SYLLABLES = "ka lo mi ne ru sa ti vo be da fe gu hi jo pe".split()
+VOCABULARY = 5000
+
+
+def vocabulary(rng):
+    """Made-up words with Zipf-distributed frequencies, like natural text; most common first."""
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(VOCABULARY * 2)})
+    rng.shuffle(words)
+    words = words[:VOCABULARY]
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+def queries(words):
+    # Words by frequency rank: very common, common, uncommon and rare, alone and combined
+    return [words[0], words[20], words[300], words[3000], f"{words[20]} {words[300]}", f"{words[0]} {words[20]} {words[300]}", "zeppelin"]
+
+
+def seed(args, rng):
+    migrate(log=lambda message: None)
+    per_test = 80
+    tests = args.questions // per_test
+    teachers = [{"id": i + 1, "email": f"teacher{i}@gmail.com", "hashed_password": "x", "role": "teacher", "disabled": 0} for i in range(args.teachers)]
+    mock_tests, sections, questions = [], [], []
+    words, weights = vocabulary(rng)
+    sentence = lambda n: " ".join(rng.choices(words, weights, k=n))
+    for test_id in range(1, tests + 1):
+        mock_tests.append({"id": test_id, "title": f"Mock {test_id}", "description": "bench", "owner_id": (test_id - 1) % args.teachers + 1})
+        base = (test_id - 1) * 3
+        sections += [
+            {"id": base + 1, "title": "listening", "mock_test_id": test_id},
+            {"id": base + 2, "title": "reading", "passage": sentence(400), "mock_test_id": test_id},
+            {"id": base + 3, "title": "writing", "task1": sentence(20), "task2": sentence(20), "mock_test_id": test_id},
+        ]
+        for i in range(per_test):
+            questions.append({"text": sentence(12), "options": ["A", "B"], "correct_answer": "A", "section_id": base + 1 + i % 2})
+    with SessionLocal() as db:
+        db.execute(insert(models.User), teachers)
+        db.execute(insert(models.MockTest), mock_tests)
+        db.execute(insert(models.MockTestSection), sections)
+        db.execute(insert(models.MockTestQuestion), questions)
+        db.commit()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        search.rebuild(conn)
+    print(f"Indexed {len(questions)} questions and {tests} mock tests in {time.perf_counter() - start:.1f} s")
+    return {"Authorization": f"Bearer {auth.create_access_token(data={'sub': teachers[0]['email']})}"}, queries(words)
+
+
+async def main(args):
+    headers, query_mix = seed(args, random.Random(args.seed))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        print(f"{'query':<34} {'hits':>6} {'p50 ms':>8} {'p95 ms':>8}")
+        for query in query_mix:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = await client.get("/search", params={"q": query}, headers=headers)
+                samples.append(time.perf_counter() - start)
+                response.raise_for_status()
+            hits = len(response.json()["items"])
+            print(f"{query:<34} {hits:>6} {percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 95) * 1000:>8.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=300000)
+    parser.add_argument("--teachers", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
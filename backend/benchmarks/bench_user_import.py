@@ -0,0 +1,66 @@
+"""Bulk user import through POST /admin/users/import, vs. one POST /users/ per user.
+
+    cd backend && python -m benchmarks.bench_user_import --users 10000
+    cd backend && python -m benchmarks.bench_user_import --users 200 --compare
+
+bcrypt dominates both paths, so users/s scales with USER_IMPORT_HASH_WORKERS
+(default: one per core). --compare also times --compare-users sign-ups one by
+one through POST /users/ for reference.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app import admission, auth, models, user_import
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.migrations import migrate
+
+
+def seed():
+    migrate(log=lambda message: None)
+    db = SessionLocal()
+    db.add(models.User(email="bench-admin@gmail.com", hashed_password="x", role="admin"))
+    db.commit()
+    db.close()
+    return auth.create_access_token(data={"sub": "bench-admin@gmail.com"})
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {seed()}"}
+    unlimited = admission.Rule(rate=1e9, burst=10**9)
+    admission.configure(ip_rule=unlimited, account_rule=unlimited, max_pending_hashes=10**9)
+    upload = "email,password\n" + "".join(f"pupil{i}@gmail.com,Pupil{i}pass\n" for i in range(args.users))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        response = await client.post("/admin/users/import", content=upload, headers={**headers, "Content-Type": "text/csv"})
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        report = response.json()
+        print(f"import: {report['created']} users in {elapsed:.1f} s ({report['created'] / elapsed:.1f} users/s, "
+              f"{user_import.import_pool.max_workers} {user_import.import_pool.kind} workers)")
+
+        if args.compare:
+            start = time.perf_counter()
+            for i in range(args.compare_users):
+                password = f"Single{i}pass"
+                payload = {"email": f"single{i}@gmail.com", "password": password, "re_password": password}
+                (await client.post("/users/", json=payload)).raise_for_status()
+            elapsed = time.perf_counter() - start
+            print(f"POST /users/: {args.compare_users} users in {elapsed:.1f} s ({args.compare_users / elapsed:.1f} users/s)")
+    user_import.import_pool.shutdown()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--compare-users", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
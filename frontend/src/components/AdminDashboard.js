@@ -2,12 +2,15 @@ import React, { useState, useEffect } from 'react';
 
 function AdminDashboard() {
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [message, setMessage] = useState('');
   const [editingUser, setEditingUser] = useState(null);
   const [editEmail, setEditEmail] = useState('');
   const [editRole, setEditRole] = useState('');
 
-  const fetchUsers = async () => {
+  // Without a cursor the list restarts from the first page; with one, the next
+  // page is appended
+  const fetchUsers = async (cursor = null) => {
     const token = localStorage.getItem('access_token');
     if (!token) {
       setMessage('Error: Not authenticated.');
@@ -15,7 +18,10 @@ function AdminDashboard() {
     }
 
     try {
-      const response = await fetch('http://localhost:8000/admin/users/', {
+      const url = cursor === null
+        ? 'http://localhost:8000/admin/users/'
+        : `http://localhost:8000/admin/users/?cursor=${encodeURIComponent(cursor)}`;
+      const response = await fetch(url, {
         headers: {
           'Authorization': `Bearer ${token}`,
         },
@@ -27,7 +33,8 @@ function AdminDashboard() {
       }
 
       const data = await response.json();
-      setUsers(data);
+      setUsers((previous) => (cursor === null ? data.items : [...previous, ...data.items]));
+      setNextCursor(data.next_cursor);
     } catch (error) {
       setMessage(`Error: ${error.message}`);
     }
@@ -175,6 +182,15 @@ function AdminDashboard() {
           ))}
         </tbody>
       </table>
+
+      {nextCursor !== null && (
+        <button
+          onClick={() => fetchUsers(nextCursor)}
+          className="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mt-4"
+        >
+          Load more
+        </button>
+      )}
     </div>
   );
 }
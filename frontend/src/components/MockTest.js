@@ -1,6 +1,24 @@
 import React, { useState, useEffect } from 'react';
 import { useParams } from 'react-router-dom';
 
+// Writing feedback is produced by a background job; poll until it finishes
+const waitForWritingFeedback = async (jobId, token) => {
+  for (let attempt = 0; attempt < 30; attempt++) {
+    const response = await fetch(`http://localhost:8000/writing-feedback/${jobId}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+    if (response.ok) {
+      const job = await response.json();
+      if (job.status === 'done') return job.feedback;
+      if (job.status === 'failed') return null;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 2000));
+  }
+  return null;
+};
+
 function MockTest() {
   const { testId } = useParams();
   const [test, setTest] = useState(null);
@@ -95,6 +113,11 @@ function MockTest() {
       setResults(data);
       setMessage('Mock test submitted for grading!');
 
+      if (data.writing_feedback_job_id) {
+        data.writing_feedback = await waitForWritingFeedback(data.writing_feedback_job_id, token);
+        setResults({ ...data });
+      }
+
       // Save test results to the backend
       const saveResultResponse = await fetch('http://localhost:8000/test-results/', {
         method: 'POST',
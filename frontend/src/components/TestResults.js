@@ -4,33 +4,41 @@ function TestResults() {
   const [testResults, setTestResults] = useState([]);
   const [message, setMessage] = useState('');
 
-  useEffect(() => {
-    const fetchTestResults = async () => {
-      const token = localStorage.getItem('access_token');
-      if (!token) {
-        setMessage('Error: Not authenticated.');
-        return;
-      }
+  const [nextCursor, setNextCursor] = useState(null);
 
-      try {
-        const response = await fetch('http://localhost:8000/test-results/me/', {
-          headers: {
-            'Authorization': `Bearer ${token}`,
-          },
-        });
+  // Without a cursor the list restarts from the first page; with one, the next
+  // page is appended
+  const fetchTestResults = async (cursor = null) => {
+    const token = localStorage.getItem('access_token');
+    if (!token) {
+      setMessage('Error: Not authenticated.');
+      return;
+    }
 
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.detail || 'Failed to fetch test results');
-        }
+    try {
+      const url = cursor === null
+        ? 'http://localhost:8000/test-results/me/'
+        : `http://localhost:8000/test-results/me/?cursor=${encodeURIComponent(cursor)}`;
+      const response = await fetch(url, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
 
-        const data = await response.json();
-        setTestResults(data);
-      } catch (error) {
-        setMessage(`Error: ${error.message}`);
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Failed to fetch test results');
       }
-    };
 
+      const data = await response.json();
+      setTestResults((previous) => (cursor === null ? data.items : [...previous, ...data.items]));
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      setMessage(`Error: ${error.message}`);
+    }
+  };
+
+  useEffect(() => {
     fetchTestResults();
   }, []);
 
@@ -60,6 +68,15 @@ function TestResults() {
           ))}
         </div>
       )}
+
+      {nextCursor !== null && (
+        <button
+          onClick={() => fetchTestResults(nextCursor)}
+          className="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mt-4"
+        >
+          Load more
+        </button>
+      )}
     </div>
   );
 }